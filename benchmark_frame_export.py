@@ -0,0 +1,96 @@
+"""
+Benchmark for frame export: draws the game world at full resolution, exports every frame to shared memory while a
+spectator process reads them, and compares export cost with frame budget
+
+    python benchmark_frame_export.py --seconds 10
+"""
+# Import section
+from argparse import ArgumentParser
+from multiprocessing import get_context
+from time import perf_counter, sleep
+
+from pygame import Surface, init
+
+from frame_export import FrameExporter, FrameReader
+from histogram import Histogram
+from spectator_example import follow_frames
+
+
+# Functions section
+def spectate(name, stop, results):
+    """Spectator process: follows exported frames until stop is set, sending back number of frames read, missed and
+    torn"""
+    reader = FrameReader(name, child_of_exporter=True)
+    totals = [0, 0, 0]
+    try:
+        while not stop.is_set():
+            for i, count in enumerate(follow_frames(reader, 0.25, report=None)):
+                totals[i] += count
+    finally:
+        reader.close()
+    results.put(totals)
+
+
+def run_phase(world, win, exporter, num_frames, frame_rate):
+    """
+    Draws and exports frames, sleeping to keep frame rate (no sleeping if frame_rate is None)
+    :return: Histograms of draw times and export times, and achieved frames per second
+    """
+    draw_times = Histogram(1e-5, 10000)  # Up to 100 ms
+    export_times = Histogram(1e-6, 10000)  # Up to 10 ms
+    start = perf_counter()
+    for frame in range(num_frames):
+        frame_start = perf_counter()
+        world.give_commands(["right", "shoot"] if frame % 100 < 50 else ["left", "shoot"])
+        world.go_to_next_frame()
+        world.draw(win)
+        draw_end = perf_counter()
+        exporter.publish(win)
+        export_end = perf_counter()
+        draw_times.add(draw_end - frame_start)
+        export_times.add(export_end - draw_end)
+        if frame_rate is not None:
+            sleep(max(0, start + (frame + 1) / frame_rate - perf_counter()))
+    return draw_times, export_times, num_frames / (perf_counter() - start)
+
+
+def main():
+    parser = ArgumentParser(description="Benchmark shared memory frame export")
+    parser.add_argument("--seconds", type=float, default=10, help="Duration of full rate phase")
+    parser.add_argument("--frame-rate", type=int, default=27, help="Game frame rate")
+    args = parser.parse_args()
+
+    init()
+    from game_classes import World  # Loads sprites and sounds, so it is imported after pygame is initialized
+
+    world = World()
+    win = Surface(world.size)
+    exporter = FrameExporter(win)
+    frame_budget = 1 / args.frame_rate
+    num_frames = int(args.seconds * args.frame_rate)
+    context = get_context("spawn")
+    results = context.Queue()
+    try:
+        for title, frame_rate, frames in ((f"Full rate ({args.frame_rate} fps)", args.frame_rate, num_frames),
+                                          ("Unthrottled", None, 4 * num_frames)):
+            stop = context.Event()
+            spectator = context.Process(target=spectate, args=(exporter.name, stop, results))
+            spectator.start()
+            sleep(1)  # Let spectator attach before first frame
+            draw_times, export_times, fps = run_phase(world, win, exporter, frames, frame_rate)
+            stop.set()
+            num_read, num_missed, num_torn = results.get()
+            spectator.join()
+            print(f"{title}, {world.width}x{world.height}, {frames} frames:")
+            print(f"\tAchieved: {fps:.1f} fps")
+            print(f"\tUpdate + draw (mean): {1000 * draw_times.mean:.2f} ms")
+            print(f"\tExport (mean/p99/max): {1000 * export_times.mean:.3f}/{1000 * export_times.percentile(99):.3f}/"
+                  f"{1000 * export_times.max_value:.3f} ms = {100 * export_times.mean / frame_budget:.2f}% of frame "
+                  f"budget")
+            print(f"\tSpectator: {num_read} frames read, {num_missed} missed, {num_torn} torn")
+    finally:
+        exporter.close()
+
+
+if __name__ == "__main__":
+    main()
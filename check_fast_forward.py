@@ -0,0 +1,117 @@
+"""
+Checks that World.advance(n) ends in exactly the same state as n calls to World.go_to_next_frame: both worlds play
+the same random inputs from the same seed, and their full state (characters, scheduled events, particles and random
+number generators) is compared after every stretch of frames
+
+    python check_fast_forward.py --seeds 40
+"""
+# Import section
+import os
+import random
+from argparse import ArgumentParser
+from time import perf_counter
+
+import numpy as np
+
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")  # Sounds are disabled in both worlds
+
+from game_classes import Animation, ScheduledEvent, TickScheduler, World
+from particles import ParticleSystem
+
+# Constant section
+commands = ["left", "right", "up", "down", "shoot"]
+stretch_lengths = [1, 5, 50, 300, 2000]  # Frames each input is held for
+ignored_attributes = {"telemetry"}  # Not part of world state
+
+
+# Functions section
+def describe(value):
+    """Returns comparable description of value, following attributes of objects (scheduler only via its events)"""
+    if isinstance(value, (list, tuple)):
+        return [describe(item) for item in value]
+    if isinstance(value, np.ndarray):
+        return value.dtype.str, value.shape, value.tobytes()
+    if isinstance(value, np.random.Generator):
+        return value.bit_generator.state
+    if isinstance(value, Animation):
+        return None  # Sprites never change
+    if isinstance(value, ScheduledEvent):
+        return value.frame, value.is_cancelled
+    if isinstance(value, TickScheduler):
+        # Cancelled events are dropped lazily, so only pending ones are part of state
+        return value.now, sorted(event.frame for _, _, event in value.events if not event.is_cancelled)
+    if hasattr(value, "__dict__"):
+        return type(value).__name__, {name: describe(attribute) for name, attribute in sorted(vars(value).items())
+                                      if name not in ignored_attributes}
+    return value
+
+
+def new_world(seed, args):
+    """Returns world (and seeds global random number generator) as every run of given seed starts"""
+    random.seed(seed)
+    world = World(pixel_perfect_collisions=args.pixel_perfect, particle_capacity=0)
+    world.particles = ParticleSystem(capacity=65536 if args.particles else 0, seed=seed)
+    world.sounds_enabled = False
+    world.goblin_cap = args.goblin_cap
+    return world
+
+
+def check_seed(seed, args):
+    """
+    Plays same inputs frame by frame and fast forwarded
+    :return: (first stretch whose end states differ or None, seconds frame by frame, seconds fast forwarded)
+    """
+    plan_generator = random.Random(seed + 1000)
+    plan = [(plan_generator.sample(commands, plan_generator.randint(0, 2)), plan_generator.choice(stretch_lengths))
+            for _ in range(args.stretches)]
+
+    stepped_world = new_world(seed, args)
+    stepped_states = []
+    stepped_time = 0
+    for stretch_commands, num_frames in plan:
+        stepped_world.give_commands(stretch_commands)
+        start = perf_counter()
+        for _ in range(num_frames):
+            stepped_world.go_to_next_frame()
+        stepped_time += perf_counter() - start
+        stepped_states.append((describe(stepped_world), random.getstate()))
+
+    advanced_world = new_world(seed, args)
+    advanced_time = 0
+    for stretch, (stretch_commands, num_frames) in enumerate(plan):
+        advanced_world.give_commands(stretch_commands)
+        start = perf_counter()
+        advanced_world.advance(num_frames)
+        advanced_time += perf_counter() - start
+        if (describe(advanced_world), random.getstate()) != stepped_states[stretch]:
+            return stretch, stepped_time, advanced_time
+    return None, stepped_time, advanced_time
+
+
+def main():
+    parser = ArgumentParser(description="Check that World.advance matches frame by frame simulation exactly")
+    parser.add_argument("--seeds", type=int, default=20, help="Number of seeds (games) checked")
+    parser.add_argument("--stretches", type=int, default=30, help="Number of input stretches per game")
+    parser.add_argument("--particles", action="store_true", help="Enable particle effects")
+    parser.add_argument("--pixel-perfect", action="store_true", help="Use pixel perfect collisions")
+    parser.add_argument("--goblin-cap", type=int, help="Fold goblins beyond this number into tougher ones")
+    args = parser.parse_args()
+
+    num_mismatches = 0
+    total_stepped_time = 0
+    total_advanced_time = 0
+    for seed in range(args.seeds):
+        mismatch, stepped_time, advanced_time = check_seed(seed, args)
+        total_stepped_time += stepped_time
+        total_advanced_time += advanced_time
+        if mismatch is not None:
+            num_mismatches += 1
+            print(f"Seed {seed}: states differ after input stretch {mismatch}")
+    print(f"{args.seeds - num_mismatches}/{args.seeds} seeds identical, frame by frame {total_stepped_time:.2f} s, "
+          f"fast forwarded {total_advanced_time:.2f} s")
+    if num_mismatches > 0:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
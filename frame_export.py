@@ -0,0 +1,200 @@
+"""
+Mirrors drawn frames into a ring of shared memory slots, so that other processes (spectators, streamers) can read
+them without pipes, sockets or serialization.
+
+Shared memory layout:
+    Header: magic, width, height, pitch, bytes per pixel, number of slots, maximum dirty rectangles per frame,
+            red/green/blue/alpha shifts and index of newest complete frame (-1 before first frame)
+    Slots:  sequence number (odd while slot is being written), frame index, timestamp (time.time()),
+            number of dirty rectangles, dirty rectangles (x, y, width, height), pixels (height rows of pitch bytes)
+"""
+# Import section
+from multiprocessing import resource_tracker, shared_memory
+from struct import Struct
+from time import time
+
+# Constant section
+magic = b"BVGFRAM1"
+header_format = Struct("<8s6I4B")
+latest_frame_format = Struct("<q")  # Stored right after header fields
+slot_header_format = Struct("<QqdI")
+rectangle_format = Struct("<4i")
+header_size = 64
+alignment = 64
+
+
+# Functions section
+def aligned(size):
+    """Rounds size up to multiple of memory alignment"""
+    return (size + alignment - 1) // alignment * alignment
+
+
+# Classes section
+class FrameLayout:
+    """Sizes and offsets of header and frame slots in shared memory"""
+
+    def __init__(self, width, height, pitch, bytes_per_pixel, num_slots, max_dirty_rects):
+        """
+        Initialize new layout
+        :param width: Frame width in pixels
+        :param height: Frame height in pixels
+        :param pitch: Number of bytes per row of pixels
+        :param bytes_per_pixel: Number of bytes per pixel
+        :param num_slots: Number of frames kept in ring
+        :param max_dirty_rects: Maximum number of dirty rectangles stored per frame
+        """
+        self.width = width
+        self.height = height
+        self.pitch = pitch
+        self.bytes_per_pixel = bytes_per_pixel
+        self.num_slots = num_slots
+        self.max_dirty_rects = max_dirty_rects
+        self.pixels_offset = aligned(slot_header_format.size + max_dirty_rects * rectangle_format.size)
+        self.pixels_size = height * pitch
+        self.slot_size = aligned(self.pixels_offset + self.pixels_size)
+        self.total_size = header_size + num_slots * self.slot_size
+
+    def slot_offset(self, frame_index):
+        """Offset of slot where frame with given index is stored"""
+        return header_size + (frame_index % self.num_slots) * self.slot_size
+
+
+class Frame:
+    """Frame read from shared memory. Its pixels are a view on shared memory, not a copy"""
+
+    def __init__(self, reader, frame_index, sequence, timestamp, dirty_rects, pixels):
+        """
+        Initialize new frame
+        :param reader: FrameReader that read frame
+        :param frame_index: Index of frame, counting from 0
+        :param sequence: Slot sequence number when frame was read
+        :param timestamp: time.time() when frame was exported
+        :param dirty_rects: List of (x, y, width, height) rectangles that changed since previous frame
+        :param pixels: Memoryview on frame pixels (height rows of pitch bytes)
+        """
+        self.reader = reader
+        self.frame_index = frame_index
+        self.sequence = sequence
+        self.timestamp = timestamp
+        self.dirty_rects = dirty_rects
+        self.pixels = pixels
+
+    @property
+    def is_valid(self):
+        """Checks that slot was not overwritten since frame was read (check after processing pixels)"""
+        return self.reader.slot_sequence(self.frame_index) == self.sequence
+
+    def release(self):
+        """Releases view on shared memory (required before reader is closed)"""
+        self.pixels.release()
+
+
+class FrameExporter:
+    """Copies drawn frames into shared memory ring"""
+
+    def __init__(self, surface, name=None, num_slots=4, max_dirty_rects=16):
+        """
+        Creates shared memory for frames with size and pixel format of given surface
+        :param surface: Surface that is going to be exported (usually game window)
+        :param name: Shared memory name readers attach to (random if None)
+        :param num_slots: Number of frames kept in ring. Readers have num_slots - 1 frames to read a frame
+        :param max_dirty_rects: Frames with more dirty rectangles than this are marked as fully dirty
+        """
+        self.layout = FrameLayout(surface.get_width(), surface.get_height(), surface.get_pitch(),
+                                  surface.get_bytesize(), num_slots, max_dirty_rects)
+        self.memory = shared_memory.SharedMemory(name, create=True, size=self.layout.total_size)
+        self.frame_index = 0
+        header_format.pack_into(self.memory.buf, 0, magic, self.layout.width, self.layout.height, self.layout.pitch,
+                                self.layout.bytes_per_pixel, num_slots, max_dirty_rects, *surface.get_shifts())
+        latest_frame_format.pack_into(self.memory.buf, header_format.size, -1)
+
+    @property
+    def name(self):
+        """Shared memory name readers attach to"""
+        return self.memory.name
+
+    def publish(self, surface, dirty_rects=None):
+        """
+        Copies surface pixels into next slot of ring
+        :param surface: Surface with same size and pixel format as exporter was created with
+        :param dirty_rects: Rectangles (x, y, width, height) that changed since previous frame. None if whole surface
+        """
+        layout = self.layout
+        if dirty_rects is None or len(dirty_rects) > layout.max_dirty_rects:
+            dirty_rects = [(0, 0, layout.width, layout.height)]
+        buffer = self.memory.buf
+        offset = layout.slot_offset(self.frame_index)
+        (sequence, _, _, _) = slot_header_format.unpack_from(buffer, offset)
+
+        # Odd sequence tells readers slot is being written
+        slot_header_format.pack_into(buffer, offset, sequence + 1, self.frame_index, time(), len(dirty_rects))
+        for i, rectangle in enumerate(dirty_rects):
+            rectangle_format.pack_into(buffer, offset + slot_header_format.size + i * rectangle_format.size,
+                                       *rectangle)
+        pixels_start = offset + layout.pixels_offset
+        buffer[pixels_start:pixels_start + layout.pixels_size] = surface.get_buffer()
+        slot_header_format.pack_into(buffer, offset, sequence + 2, self.frame_index, time(), len(dirty_rects))
+
+        latest_frame_format.pack_into(buffer, header_format.size, self.frame_index)
+        self.frame_index += 1
+
+    def close(self):
+        """Releases and removes shared memory"""
+        self.memory.close()
+        self.memory.unlink()
+
+
+class FrameReader:
+    """Reads frames exported by FrameExporter in another process"""
+
+    def __init__(self, name, child_of_exporter=False):
+        """
+        Attaches to shared memory created by exporter
+        :param name: Shared memory name
+        :param child_of_exporter: True if reader runs in a process started by the exporter's process (they share the
+        resource tracker, which then already knows exporter removes shared memory)
+        """
+        self.memory = shared_memory.SharedMemory(name)
+        if not child_of_exporter:
+            # Exporter owns shared memory, so reader's resource tracker must not remove it when reader exits
+            resource_tracker.unregister(self.memory._name, "shared_memory")
+        fields = header_format.unpack_from(self.memory.buf, 0)
+        if fields[0] != magic:
+            raise ValueError(f"Shared memory {name} does not hold exported frames")
+        width, height, pitch, bytes_per_pixel, num_slots, max_dirty_rects = fields[1:7]
+        self.shifts = fields[7:11]
+        self.layout = FrameLayout(width, height, pitch, bytes_per_pixel, num_slots, max_dirty_rects)
+
+    @property
+    def latest_frame_index(self):
+        """Index of newest complete frame (-1 if no frame was exported yet)"""
+        return latest_frame_format.unpack_from(self.memory.buf, header_format.size)[0]
+
+    def slot_sequence(self, frame_index):
+        """Sequence number of slot where frame with given index is stored"""
+        return slot_header_format.unpack_from(self.memory.buf, self.layout.slot_offset(frame_index))[0]
+
+    def read(self, frame_index):
+        """
+        Returns frame with given index, or None if it is being written or was already overwritten
+        :param frame_index: Index of frame, usually latest_frame_index
+        """
+        layout = self.layout
+        buffer = self.memory.buf
+        offset = layout.slot_offset(frame_index)
+        sequence, stored_index, timestamp, num_dirty_rects = slot_header_format.unpack_from(buffer, offset)
+        if sequence % 2 == 1 or stored_index != frame_index:
+            return None
+        dirty_rects = [rectangle_format.unpack_from(buffer, offset + slot_header_format.size +
+                                                    i * rectangle_format.size) for i in range(num_dirty_rects)]
+        pixels_start = offset + layout.pixels_offset
+        frame = Frame(self, frame_index, sequence, timestamp, dirty_rects,
+                      buffer[pixels_start:pixels_start + layout.pixels_size])
+        if not frame.is_valid:
+            frame.release()
+            return None
+        return frame
+
+    def close(self):
+        """Detaches from shared memory (frames must have been released)"""
+        self.memory.close()
@@ -1,6 +1,11 @@
 # Import section
+import logging
+from copy import copy
+from heapq import heappop, heappush
+from math import ceil, log
 from random import randint, random
-from pygame import image, draw, font, mixer
+from pygame import image, draw, font, mixer, mask
+
 
 # Set mixer
 mixer.init(buffer=512)  # Default 4096, but smaller makes sound less laggy
@@ -13,26 +18,86 @@ gruntSound = mixer.Sound("Resources/SoundEffects/pain.wav")
 potionSound = mixer.Sound("Resources/SoundEffects/potion.wav")
 background_music = mixer.music.load("Resources/SoundEffects/background_music.mp3")
 
+logger = logging.getLogger(__name__)
+
+
+# Functions section
+def frames_until_success(probability):
+    """
+    Returns number of frames until an event with given chance per frame happens (geometric distribution).
+    Drawing it once is equivalent to rolling the chance on every frame
+    :param probability: Chance of event happening on each frame
+    :return: 1 if event happens on first frame, 2 if on second frame, etc
+    """
+    return int(log(1 - random()) / log(1 - probability)) + 1
+
+
+def circle_mask(radius):
+    """Returns mask of filled circle with given radius (mask size is 2 * radius + 1)"""
+    circle = mask.Mask((2 * radius + 1, 2 * radius + 1))
+    for x in range(-radius, radius + 1):
+        for y in range(-radius, radius + 1):
+            if x * x + y * y <= radius * radius:
+                circle.set_at((x + radius, y + radius))
+    return circle
+
+
+def masks_overlap(first_mask, first_position, second_mask, second_position):
+    """
+    Checks if two masks have set pixels in common
+    :param first_mask: Mask of first object
+    :param first_position: Position of top/left vertex of first mask
+    :param second_mask: Mask of second object
+    :param second_position: Position of top/left vertex of second mask
+    """
+    offset = (int(second_position[0]) - int(first_position[0]), int(second_position[1]) - int(first_position[1]))
+    return first_mask.overlap(second_mask, offset) is not None
+
 
 # Classes section
 class World:
     """2D rectangular world where game takes place"""
     gravitational_acceleration = 2.8
     background_img = image.load('Resources/bg.jpg')
+    potion_spawn_probability = 0.01  # Chance per frame of potion appearing when there is none
+    goblin_spawn_probability = 0.01  # Chance per frame of goblin appearing when there are fewer than allowed
 
-    def __init__(self, ground_padding=3):
+    def __init__(self, ground_padding=3, pixel_perfect_collisions=False, particle_capacity=65536):
         """
         Initialize new world from background image
         :param ground_padding: How much of screen bottom is inaccessible to characters (as percentage of total height)
+        :param pixel_perfect_collisions: True if objects only collide when their visible pixels overlap, False if
+        overlapping hit boxes are enough
+        :param particle_capacity: Maximum number of live particles in effects (0 for no effects, e.g. in headless worlds,
+        which then don't need numpy)
         """
         self.size = (World.background_img.get_width(), World.background_img.get_height())
         self.ground_level = self.height * (100 - ground_padding) / 100
         self.score = 0
         self.max_num_goblins = 3
-        self.baldy = MainCharacter((self.width / 2, self.ground_level - MainCharacter.height))
+        self.pixel_perfect_collisions = pixel_perfect_collisions
+        self.scheduler = TickScheduler()
+        self.potion_spawn_event = None
+        self.goblin_spawn_event = None
+        self.baldy = MainCharacter((self.width / 2, self.ground_level - MainCharacter.height), self.scheduler)
         self.goblins = []
         self.bullets = []
         self.potions = []
+        if particle_capacity > 0:
+            from particles import ParticleSystem
+            self.particles = ParticleSystem(particle_capacity)
+        else:
+            self.particles = NoParticles()
+        # Quality settings (lowered by FrameBudgetGovernor when frames take too long)
+        self.animation_stride = 1  # Animations advance once every animation_stride frames
+        self.hp_bar_draw_distance = None  # Goblins farther than this from main character have no HP bar drawn
+        self.sounds_enabled = True
+        self.goblin_cap = None  # Extra goblins are folded into tougher ones
+        # Session statistics
+        self.potions_taken = 0
+        self.shots_fired = 0
+        self.shots_hit = 0
+        self.telemetry = None  # SessionTelemetry that records world state on every frame
 
     def draw_intro(self, win):
         """
@@ -96,7 +161,14 @@ class World:
         x_coord = randint(0, max_x)
         y_coord = randint(0, 10) - 2 + self.ground_level - Potion.height
 
-        self.potions.append(Potion((x_coord, y_coord)))
+        potion = Potion((x_coord, y_coord), self.scheduler)
+        potion.expiry_event = self.scheduler.schedule(Potion.life_span, lambda: self.remove_potion(potion))
+        self.potions.append(potion)
+
+    def remove_potion(self, potion):
+        """Removes potion from world (when it's taken or expires)"""
+        potion.expiry_event.cancel()
+        self.potions.remove(potion)
 
     def spawn_goblin(self):
         """Spawn goblin in random position"""
@@ -104,7 +176,60 @@ class World:
         x_coord = 0 if r < .5 else self.width
         y_coord = randint(0, 10) - 2 + self.ground_level - Goblin.height
 
-        self.goblins.append(Goblin((x_coord, y_coord)))
+        goblin = Goblin((x_coord, y_coord))
+        self.schedule_direction_change(goblin)
+        self.goblins.append(goblin)
+
+    def remove_goblin(self, goblin):
+        """Removes goblin from world (when it dies or is folded into another goblin)"""
+        goblin.direction_change_event.cancel()
+        self.goblins.remove(goblin)
+
+    def schedule_direction_change(self, goblin):
+        """Schedules next time goblin changes direction on its own"""
+        delay = frames_until_success(Goblin.direction_change_probability)
+        goblin.direction_change_event = self.scheduler.schedule(delay, lambda: self.change_direction(goblin))
+
+    def change_direction(self, goblin):
+        """Turns goblin around (unless it's touching a wall, which already decides its direction)"""
+        if not goblin.is_touching_wall(self):
+            goblin.set_direction(not goblin.is_walking_right)
+        self.schedule_direction_change(goblin)
+
+    def schedule_spawns(self):
+        """Schedules potion and goblin spawns when they are missing and not scheduled yet"""
+        if len(self.potions) == 0 and self.potion_spawn_event is None:
+            # Spawn chance is first rolled on this frame
+            delay = frames_until_success(World.potion_spawn_probability) - 1
+            self.potion_spawn_event = self.scheduler.schedule(delay, self.spawn_scheduled_potion)
+        if len(self.goblins) < self.goblin_limit and self.goblin_spawn_event is None:
+            delay = frames_until_success(World.goblin_spawn_probability) - 1
+            self.goblin_spawn_event = self.scheduler.schedule(delay, self.spawn_scheduled_goblin)
+
+    def postpone_goblin_spawn(self):
+        """
+        Reschedules goblin spawn so its chance is next rolled on next frame, after a goblin was spawned on this one
+        (chance is rolled at most once per frame, and not at all when goblin was spawned because there were none)
+        """
+        if self.goblin_spawn_event is not None:
+            self.goblin_spawn_event.cancel()
+            self.goblin_spawn_event = None
+        if len(self.goblins) < self.goblin_limit:
+            delay = frames_until_success(World.goblin_spawn_probability)
+            self.goblin_spawn_event = self.scheduler.schedule(delay, self.spawn_scheduled_goblin)
+
+    def spawn_scheduled_potion(self):
+        """Spawns potion when its scheduled time comes"""
+        self.potion_spawn_event = None
+        if len(self.potions) == 0:
+            self.spawn_potion()
+
+    def spawn_scheduled_goblin(self):
+        """Spawns goblin when its scheduled time comes, if there is still room for it"""
+        self.goblin_spawn_event = None
+        if len(self.goblins) < self.goblin_limit:
+            self.spawn_goblin()
+            self.postpone_goblin_spawn()
 
     def give_commands(self, commands):
         """Gives list of commands to world"""
@@ -123,8 +248,15 @@ class World:
         if "shoot" in commands:
             new_bullet = self.baldy.shoot()
             if new_bullet is not None:
+                self.play_sound(throwSound)
+                self.shots_fired += 1
                 self.bullets.append(new_bullet)
 
+    def play_sound(self, sound):
+        """Plays sound effect, unless sounds were disabled"""
+        if self.sounds_enabled:
+            sound.play()
+
     @property
     def width(self):
         """World width in pixels"""
@@ -140,27 +272,47 @@ class World:
         self.score += increase_amount
         self.max_num_goblins = self.score // 200 + 3
 
+    @property
+    def goblin_limit(self):
+        """Maximum number of goblins that may be alive at the same time"""
+        if self.goblin_cap is None:
+            return self.max_num_goblins
+        return min(self.max_num_goblins, self.goblin_cap)
+
+    def fold_extra_goblins(self):
+        """Removes goblins above goblin cap, giving their health points to the weakest remaining goblins"""
+        while self.goblin_cap is not None and len(self.goblins) > max(self.goblin_cap, 1):
+            extra_goblin = self.goblins[-1]
+            self.remove_goblin(extra_goblin)
+            weakest_goblin = min(self.goblins, key=lambda goblin: goblin.hp_bar.max_health_points)
+            weakest_goblin.absorb(extra_goblin)
+
+    @property
+    def frame_count(self):
+        """Number of frames since world was created"""
+        return self.scheduler.now
+
     def go_to_next_frame(self):
         """Move world to next frame"""
+        self.scheduler.now += 1
+        self.particles.go_to_next_frame(self)
         self.baldy.go_to_next_frame(self)
         for potion in self.potions:
             # Check collision between potion and main character
-            if self.baldy.hit_box.collided_with(potion.hit_box):
+            if self.baldy.hit_box.collided_with(potion.hit_box) and self.sprites_overlap(self.baldy, potion):
                 self.baldy.hp_bar.heal(5)
-                potionSound.play()
-                self.potions.remove(potion)
-            else:
-                potion.go_to_next_frame()
-                if potion.is_expired:
-                    self.potions.remove(potion)
+                self.play_sound(potionSound)
+                self.particles.emit_potion_sparkles(potion.hit_box.center)
+                self.potions_taken += 1
+                self.remove_potion(potion)
 
         for goblin in self.goblins:
             goblin.go_to_next_frame(self)
             # Check collision between goblin and main character
-            if self.baldy.hit_box.collided_with(goblin.hit_box):
+            if self.baldy.hit_box.collided_with(goblin.hit_box) and self.sprites_overlap(self.baldy, goblin):
 
                 if self.baldy.damaged_by_goblin():
-                    gruntSound.play()
+                    self.play_sound(gruntSound)
 
         for bullet in self.bullets:
             bullet.go_to_next_frame()
@@ -169,37 +321,112 @@ class World:
             else:
                 # Check collision between bullet and goblin
                 for goblin in self.goblins:
-                    if bullet.collided_with(goblin.hit_box):
-                        hitSound.play()
+                    if bullet.collided_with(goblin.hit_box) and self.sprites_overlap(bullet, goblin):
+                        self.play_sound(hitSound)
+                        self.shots_hit += 1
                         self.bullets.remove(bullet)
+                        self.particles.emit_hit_sparks((bullet.x, bullet.y), bullet.is_going_right)
                         goblin.hp_bar.deal_damage(5)
                         if goblin.is_dead:
+                            self.particles.emit_death_burst(goblin.hit_box.center)
                             self.increase_score(10)
-                            self.goblins.remove(goblin)
+                            self.remove_goblin(goblin)
                         else:
                             self.increase_score(1)
                         break
 
-        # Spawn new potion
-        if len(self.potions) == 0:
-            r = random()
-            if r < 0.01:
-                self.spawn_potion()
-
-        # Spawn new goblins
-        num_goblins = len(self.goblins)
-        if num_goblins == 0:
+        self.fold_extra_goblins()
+        if len(self.goblins) == 0:
             # Prevents game from having 0 goblins
             self.spawn_goblin()
-        elif num_goblins < self.max_num_goblins:
-            r = random()
-            if r < 0.01:
-                self.spawn_goblin()
+            self.postpone_goblin_spawn()
 
-    def draw(self, win):
+        # Potion expiry and goblin direction changes, then spawns (whose chance is first rolled on this frame, after
+        # potions expired)
+        self.scheduler.run_due_events()
+        self.schedule_spawns()
+        self.scheduler.run_due_events()
+
+        if self.telemetry is not None and self.frame_count % self.telemetry.sample_interval == 0:
+            self.telemetry.record(self)
+
+    def advance(self, num_frames):
+        """
+        Moves world num_frames frames forward, ending in the same state as calling go_to_next_frame num_frames times.
+        Stretches where nothing can collide, spawn or change on its own are skipped in closed form, and only frames
+        around interactions and scheduled events are simulated one by one
+        :param num_frames: Number of frames to move forward
+        """
+        frames_left = num_frames
+        while frames_left > 0:
+            quiet_frames = self.count_quiet_frames(frames_left)
+            if quiet_frames == 0:
+                self.go_to_next_frame()
+                frames_left -= 1
+            else:
+                self.skip_quiet_frames(quiet_frames)
+                frames_left -= quiet_frames
+
+    def count_quiet_frames(self, max_frames):
+        """
+        Returns how many of next frames (up to max_frames) are certain to have no collisions, spawns, folds, particles
+        or scheduled events, so that characters simply walk (goblins bouncing off walls) and jump
+        """
+        if self.bullets or self.goblins == [] or not self.particles.is_empty:
+            return 0
+        if self.goblin_cap is not None and len(self.goblins) > max(self.goblin_cap, 1):
+            return 0
+        if len(self.potions) == 0 and self.potion_spawn_event is None:
+            return 0
+        if len(self.goblins) < self.goblin_limit and self.goblin_spawn_event is None:
+            return 0
+
+        quiet_frames = max_frames
+        next_event_frame = self.scheduler.next_event_frame
+        if next_event_frame is not None:
+            # Events run at the end of their frame, so that frame must be simulated
+            quiet_frames = min(quiet_frames, next_event_frame - self.frame_count - 1)
+
+        # Hit boxes can only collide after the horizontal gap between them closes
+        baldy_box = self.baldy.hit_box
+        baldy_speed = self.baldy.horizontal_speed
+        for other_box, other_speed in [(goblin.hit_box, goblin.walking_velocity) for goblin in self.goblins] + \
+                                      [(potion.hit_box, 0) for potion in self.potions]:
+            gap = max(other_box.x_coord - (baldy_box.x_coord + baldy_box.width),
+                      baldy_box.x_coord - (other_box.x_coord + other_box.width))
+            if gap <= 0:
+                return 0
+            closing_speed = baldy_speed + other_speed
+            if closing_speed > 0:
+                quiet_frames = min(quiet_frames, ceil(gap / closing_speed) - 1)
+        return max(quiet_frames, 0)
+
+    def skip_quiet_frames(self, num_frames):
+        """
+        Moves world num_frames frames forward when they are known to be quiet (see count_quiet_frames)
+        :param num_frames: Number of frames to skip
+        """
+        first_frame = self.frame_count + 1
+        self.scheduler.now += num_frames
+        self.particles.go_to_next_frame(self)
+        self.baldy.skip_frames(self, num_frames)
+        for goblin in self.goblins:
+            goblin.skip_frames(self, num_frames)
+
+        if self.telemetry is not None:
+            # Nothing recorded changes in quiet frames, except frame count
+            last_frame = self.frame_count
+            interval = self.telemetry.sample_interval
+            for frame in range(ceil(first_frame / interval) * interval, last_frame + 1, interval):
+                self.scheduler.now = frame
+                self.telemetry.record(self)
+            self.scheduler.now = last_frame
+
+    def draw(self, win, advance_animations=True):
         """
         Draw world on given window
         :param win: Game window
+        :param advance_animations: False if animations should stay on the same frame (used for drawing snapshots)
         """
         # Redraw background
         win.blit(World.background_img, (0, 0))
@@ -215,8 +442,9 @@ class World:
             # potion.draw_hit_box(win)  # -> Useful for debugging
 
         # Draw goblins
+        advance_animation = advance_animations and self.animations_advance_on_this_frame
         for goblin in self.goblins:
-            goblin.draw(win)
+            goblin.draw(win, advance_animation, self.is_near_main_character(goblin))
             # goblin.draw_hit_box(win)  # -> Useful for debugging
 
         # Draw bullets
@@ -224,13 +452,152 @@ class World:
             bullet.draw(win)
 
         # Draw main character
-        self.baldy.draw(win)
+        self.baldy.draw(win, advance_animation)
+
         # self.baldy.draw_hit_box(win)  #-> Useful for debugging
 
+        # Draw particle effects
+        self.particles.draw(win)
+
+    def sprites_overlap(self, first, second):
+        """
+        Checks if visible pixels of two objects overlap, given that their hit boxes already do.
+        Always True when pixel perfect collisions are disabled
+        """
+        if not self.pixel_perfect_collisions:
+            return True
+        return masks_overlap(first.mask, first.mask_position, second.mask, second.mask_position)
+
+    @property
+    def animations_advance_on_this_frame(self):
+        """Checks if animations move to their next sprite when world is drawn on this frame"""
+        return self.frame_count % self.animation_stride == 0
+
+    def advance_animations(self):
+        """Advances animations exactly as drawing the world would, without drawing it"""
+        if not self.animations_advance_on_this_frame:
+            return
+        for goblin in self.goblins:
+            goblin.advance_animation()
+        if self.baldy.shows_walking_animation:
+            self.baldy.advance_animation()
+
+    def snapshot(self):
+        """
+        Returns copy of world that can be drawn (with advance_animations=False) while this world moves on to next
+        frames. Animations of this world advance as if it had been drawn
+        """
+        world_copy = copy(self)
+        # Timers of copied objects are measured against a clock that no longer moves
+        world_copy.scheduler = copy(self.scheduler)
+        world_copy.baldy = self.baldy.snapshot()
+        world_copy.baldy.scheduler = world_copy.scheduler
+        world_copy.goblins = [goblin.snapshot() for goblin in self.goblins]
+        world_copy.bullets = [copy(bullet) for bullet in self.bullets]
+        world_copy.potions = [copy(potion) for potion in self.potions]
+        for potion in world_copy.potions:
+            potion.scheduler = world_copy.scheduler
+        world_copy.particles = self.particles.snapshot()
+        self.advance_animations()
+        return world_copy
+
+    def is_near_main_character(self, character):
+        """Checks if character is within HP bar draw distance of main character"""
+        if self.hp_bar_draw_distance is None:
+            return True
+        return abs(character.hit_box.x_coord - self.baldy.hit_box.x_coord) <= self.hp_bar_draw_distance
+
     def __str__(self):
         return f"\tWorld size (width, height): {self.size}\n\tGround level: {self.ground_level}"
 
 
+class ScheduledEvent:
+    """Callback that runs on a given frame, unless it's cancelled"""
+
+    def __init__(self, frame, callback):
+        """
+        Initialize new event
+        :param frame: Frame when callback runs
+        :param callback: Function without arguments
+        """
+        self.frame = frame
+        self.callback = callback
+        self.is_cancelled = False
+
+    def cancel(self):
+        """Prevents callback from running"""
+        self.is_cancelled = True
+
+
+class TickScheduler:
+    """
+    Frame clock with a heap of scheduled events. Timers and random spawns are scheduled once instead of being
+    counted down or rolled on every frame, so only frames when something happens cost anything
+    """
+
+    def __init__(self):
+        """Initialize new scheduler at frame 0"""
+        self.now = 0
+        self.events = []  # Heap of (frame, sequence number, event)
+        self.num_scheduled = 0  # Keeps events scheduled for the same frame in order
+
+    def schedule(self, delay, callback):
+        """
+        Schedules callback to run after given number of frames
+        :param delay: Number of frames from now (0 runs it on this frame, if events are still being run)
+        :param callback: Function without arguments
+        :return: ScheduledEvent that may be cancelled
+        """
+        event = ScheduledEvent(self.now + delay, callback)
+        heappush(self.events, (event.frame, self.num_scheduled, event))
+        self.num_scheduled += 1
+        return event
+
+    @property
+    def next_event_frame(self):
+        """Frame of next event that is not cancelled (None if there is none)"""
+        while self.events and self.events[0][2].is_cancelled:
+            heappop(self.events)
+        return self.events[0][0] if self.events else None
+
+    def run_due_events(self):
+        """Runs callbacks of events scheduled up to current frame, in order"""
+        while self.events and self.events[0][0] <= self.now:
+            _, _, event = heappop(self.events)
+            if not event.is_cancelled:
+                event.callback()
+
+    def __str__(self):
+        return f"\tFrame: {self.now}\n\tScheduled events: {len(self.events)}"
+
+
+class NoParticles:
+    """Stands in for a particle system in worlds without particle effects: every effect is ignored"""
+    is_empty = True
+
+    def emit_hit_sparks(self, position, is_going_right):
+        pass
+
+    def emit_death_burst(self, position):
+        pass
+
+    def emit_potion_sparkles(self, position):
+        pass
+
+    def go_to_next_frame(self, world):
+        pass
+
+    def snapshot(self):
+        """Returns itself, as there is nothing to copy"""
+        return self
+
+    def draw(self, win):
+        pass
+
+    def __str__(self):
+        return "\tNo particle effects"
+
+
 class Animation:
     """
     Class for list of sprites that are displayed sequentially
@@ -250,6 +617,8 @@ class Animation:
                 raise Exception("All sprites must have the same width and height")
         '''
         self.sprites = sprites
+        # Masks are used for pixel perfect collisions
+        self.masks = [mask.from_surface(sprite) for sprite in sprites]
         self.frames_per_sprite = frames_per_sprite
         self.max_animation_count = len(self.sprites) * self.frames_per_sprite
 
@@ -257,17 +626,28 @@ class Animation:
         """Returns sprite with given index"""
         return self.sprites[sprite_index]
 
-    def draw_and_increment(self, animation_count, position, win):
+    def get_mask(self, animation_count):
+        """Returns mask of sprite displayed on given animation frame"""
+        return self.masks[animation_count // self.frames_per_sprite]
+
+    def draw_and_increment(self, animation_count, position, win, increment=True):
         """
         Draws animation in given position and window
         :param animation_count: Index of animation frame
         :param position: Position of top/left vertex
         :param win: Window where animation is displayed
+        :param increment: False if animation should stay on the same frame
         :return: Index of next animation count
         """
         sprite_index = animation_count // self.frames_per_sprite
         win.blit(self.sprites[sprite_index], position)
 
+        if not increment:
+            return animation_count
+        return self.next_animation_count(animation_count)
+
+    def next_animation_count(self, animation_count):
+        """Returns index of animation frame that comes after given one"""
         new_animation_count = animation_count + 1
         if new_animation_count >= self.max_animation_count:
             new_animation_count = 0
@@ -317,6 +697,11 @@ class Rectangle:
         """Rectangle height in pixels"""
         return self.size[1]
 
+    @property
+    def center(self):
+        """Coordinates of rectangle center"""
+        return self.x_coord + self.width / 2, self.y_coord + self.height / 2
+
     @property
     def x_coord(self):
         """X coordinate of top/left vertex"""
@@ -398,6 +783,12 @@ class HealthPoints:
             self.health_points = self.max_health_points
         self.set_green_rectangle_width()
 
+    def increase_max_health_points(self, extra_health_points):
+        """Raises maximum health points, healing character by the same amount"""
+        self.max_health_points += extra_health_points
+        self.health_points += extra_health_points
+        self.set_green_rectangle_width()
+
     def health_bar_position(self, character):
         """
         Sets health bar position where character is
@@ -437,6 +828,7 @@ class HealthPoints:
 class Potion:
     """Potion for healing main character"""
     potion_image = image.load("Resources/potion.png")
+    potion_mask = mask.from_surface(potion_image)
     life_span = 200  # Number of frames that potion exists for
     height = potion_image.get_height()
     width = potion_image.get_width()
@@ -446,22 +838,34 @@ class Potion:
     horizontal_displacement = (width - max_progress_bar_width) / 2
     vertical_displacement = height + spacing
 
-    def __init__(self, position):
-        """Initialize new potion"""
+    def __init__(self, position, scheduler):
+        """
+        Initialize new potion
+        :param position: Position of top/left vertex
+        :param scheduler: Scheduler whose clock measures potion's life span
+        """
         self.hit_box = Rectangle((Potion.width, Potion.height), position)
-        self.timer = Potion.life_span
+        self.scheduler = scheduler
+        self.expiry_frame = scheduler.now + Potion.life_span
+        self.expiry_event = None  # Removes potion from world when it expires
         timer_bar_x_coord = self.hit_box.x_coord + Potion.horizontal_displacement
         timer_bar_y_coord = self.hit_box.y_coord - Potion.vertical_displacement
         self.bar_position = (timer_bar_x_coord, timer_bar_y_coord)
 
     @property
-    def is_expired(self):
-        """Check if potion expired"""
-        return self.timer <= 0
+    def mask(self):
+        """Mask of potion image"""
+        return Potion.potion_mask
 
-    def go_to_next_frame(self):
-        """Moves potion to next frame"""
-        self.timer -= 1
+    @property
+    def mask_position(self):
+        """Position of top/left vertex of mask"""
+        return self.hit_box.position
+
+    @property
+    def timer(self):
+        """Number of frames left before potion expires"""
+        return max(0, self.expiry_frame - self.scheduler.now)
 
     def draw(self, win):
         win.blit(Potion.potion_image, self.hit_box.position)
@@ -479,6 +883,7 @@ class Bullet:
     """Bullet that main character shoots"""
     bullet_speed = 20  # In pixels per frame
     bullet_radius = 3
+    bullet_mask = circle_mask(bullet_radius)
 
     def __init__(self, initial_position, is_going_right):
         """
@@ -497,6 +902,16 @@ class Bullet:
         """Move bullet to next frame"""
         self.x += self.signed_speed
 
+    @property
+    def mask(self):
+        """Mask of bullet circle"""
+        return Bullet.bullet_mask
+
+    @property
+    def mask_position(self):
+        """Position of top/left vertex of mask"""
+        return self.x - Bullet.bullet_radius, self.y - Bullet.bullet_radius
+
     def left_world(self, world):
         """Checks if bullet has left the world"""
         return self.x - Bullet.bullet_radius > world.width or self.x + Bullet.bullet_radius < 0
@@ -557,6 +972,32 @@ class Character:
         """Sets animation count back to 0"""
         self.animation_count = 0
 
+    @property
+    def current_animation(self):
+        """Animation for direction character is walking"""
+        return self.walk_right_animation if self.is_walking_right else self.walk_left_animation
+
+    @property
+    def mask(self):
+        """Mask of sprite that is displayed on current animation frame"""
+        return self.current_animation.get_mask(self.animation_count)
+
+    @property
+    def mask_position(self):
+        """Position of top/left vertex of mask"""
+        return self.hit_box.position
+
+    def advance_animation(self):
+        """Moves animation to next frame without drawing it"""
+        self.animation_count = self.current_animation.next_animation_count(self.animation_count)
+
+    def snapshot(self):
+        """Returns copy of character that is not affected by changes to this character"""
+        character_copy = copy(self)
+        character_copy.hit_box = copy(self.hit_box)
+        character_copy.hp_bar = copy(self.hp_bar)
+        return character_copy
+
     def set_direction(self, is_going_right):
         """
         Sets character direction
@@ -579,19 +1020,27 @@ class Character:
         self.hit_box.x_coord += horizontal_displacement
         self.hit_box.keep_in_world(world)
 
-    def draw(self, win):
+    def skip_frames(self, world, num_frames):
+        """
+        Moves character num_frames frames forward, as if go_to_next_frame was called that many times
+        :param world: World that constrains character
+        :param num_frames: Number of frames
+        """
+        for _ in range(num_frames):
+            self.go_to_next_frame(world)
+
+    def draw(self, win, advance_animation=True, draw_hp_bar=True):
         """
         Draw character on given window
         :param win: Window where character is to be drawn
+        :param advance_animation: False if animation should stay on the same frame
+        :param draw_hp_bar: False if HP bar should not be drawn
         """
-        if self.is_walking_right:
-            self.animation_count = self.walk_right_animation.draw_and_increment(self.animation_count,
-                                                                                self.hit_box.position, win)
-        else:
-            self.animation_count = self.walk_left_animation.draw_and_increment(self.animation_count,
-                                                                               self.hit_box.position, win)
+        self.animation_count = self.current_animation.draw_and_increment(self.animation_count, self.hit_box.position,
+                                                                          win, advance_animation)
 
-        self.hp_bar.draw(self, win)
+        if draw_hp_bar:
+            self.hp_bar.draw(self, win)
 
     def draw_hit_box(self, win):
         """Draw enclosing rectangle around character"""
@@ -614,6 +1063,7 @@ class Goblin(Character):
          image.load('Resources/L7E.png'), image.load('Resources/L8E.png'), image.load('Resources/L9E.png'),
          image.load('Resources/L10E.png'), image.load('Resources/L11E.png')])
     height = goblin_walking_right.dimensions[1]
+    direction_change_probability = 0.005  # Chance per frame of goblin changing direction on its own
 
     def __init__(self, initial_position, velocity_range=(2, 5)):
         """
@@ -622,16 +1072,51 @@ class Goblin(Character):
         """
         walking_velocity = randint(velocity_range[0], velocity_range[1])
         super().__init__(initial_position, Goblin.goblin_walking_right, Goblin.goblin_walking_left, walking_velocity)
+        self.direction_change_event = None  # Scheduled by world
 
-    def change_direction_randomly(self):
-        """0.5% Chance of changing goblin's direction"""
-        r = random()
-        if r < 0.005:
+    def is_touching_wall(self, world):
+        """Checks if goblin is at left or right edge of world"""
+        return self.hit_box.x_coord <= 0 or self.hit_box.x_coord + self.hit_box.width >= world.width
+
+    def skip_frames(self, world, num_frames):
+        """
+        Walks goblin num_frames frames at once, bouncing off walls, as if go_to_next_frame was called that many times
+        (no random direction change may be scheduled in between)
+        :param world: World where goblin is
+        :param num_frames: Number of frames
+        """
+        max_x = world.width - self.hit_box.width
+        x_coord = self.hit_box.x_coord
+        if not (0 <= x_coord <= max_x and float(x_coord).is_integer() and float(self.walking_velocity).is_integer()):
+            # Closed form is only exact for whole pixel positions inside world
+            super().skip_frames(world, num_frames)
+            return
+
+        frames_left = num_frames
+        while frames_left > 0:
+            distance_to_wall = max_x - x_coord if self.is_walking_right else x_coord
+            frames_to_wall = max(1, ceil(distance_to_wall / self.walking_velocity))
+            if frames_to_wall > frames_left:
+                x_coord += frames_left * self.walking_velocity if self.is_walking_right else \
+                    -frames_left * self.walking_velocity
+                break
+            x_coord = max_x if self.is_walking_right else 0
+            frames_left -= frames_to_wall
             self.set_direction(not self.is_walking_right)
 
+        self.hit_box.x_coord = x_coord
+        self.hit_box.keep_in_world(world)
+
+    def absorb(self, other):
+        """
+        Makes goblin tougher by taking over remaining health points of another goblin
+        :param other: Goblin that is removed from world
+        """
+        self.hp_bar.increase_max_health_points(other.hp_bar.health_points)
+
     def go_to_next_frame(self, world):
         """
-        Moves goblin in world, and changes his direction randomly
+        Moves goblin in world, turning him around if he hits a wall (random direction changes are scheduled by world)
         :param world: World where goblin is
         """
         super().go_to_next_frame(world)
@@ -640,12 +1125,11 @@ class Goblin(Character):
             self.set_direction(is_going_right=True)
         elif self.hit_box.x_coord + self.hit_box.width >= world.width:
             self.set_direction(is_going_right=False)
-        else:
-            self.change_direction_randomly()
 
 
 class MainCharacter(Character):
     facing_camera_sprite = image.load('Resources/standing.png')
+    facing_camera_mask = mask.from_surface(facing_camera_sprite)
     laying_dead_sprite = image.load('Resources/dead_baldy.png')
     char_walking_right = Animation(
         [image.load('Resources/R1.png'), image.load('Resources/R2.png'), image.load('Resources/R3.png'),
@@ -660,21 +1144,23 @@ class MainCharacter(Character):
     damage_immunity_time = 60  # Number of frames that character is immune from new damage after taking damage
     bullet_latency = 14  # Number of frames that character must wait between shots
 
-    def __init__(self, initial_position):
+    def __init__(self, initial_position, scheduler):
         """
         Initialize new main character
         :param initial_position: Initial position in pixels
+        :param scheduler: Scheduler whose clock measures damage immunity and bullet latency
         """
         super().__init__(initial_position, MainCharacter.char_walking_right, MainCharacter.char_walking_left,
                          MainCharacter.walking_velocity)
+        self.scheduler = scheduler
         self.is_walking = False
         self.is_facing_left = False
         self.is_facing_right = False
         self.is_jumping = False
         self.vertical_velocity = 0
         self.horizontal_jump_velocity = 0
-        self.damage_count = 0  # Counts down when character took damage
-        self.bullet_latency_count = 0  # Counts down when character shoots
+        self.immunity_end_frame = 0  # Frame when damage immunity ends
+        self.next_shot_frame = 0  # First frame when character can shoot again
 
     def shoot(self):
         """Returns new bullet if character can make a shot. Otherwise returns None"""
@@ -686,12 +1172,20 @@ class MainCharacter(Character):
             is_going_right = True
         else:
             return None
-        self.bullet_latency_count = MainCharacter.bullet_latency
+        self.next_shot_frame = self.scheduler.now + MainCharacter.bullet_latency
         position = (self.hit_box.x_coord + self.hit_box.width / 2, self.hit_box.y_coord + self.hit_box.height / 2)
-        # Play bullet sound
-        throwSound.play()
         return Bullet(position, is_going_right)
 
+    @property
+    def damage_count(self):
+        """Number of frames left of damage immunity"""
+        return max(0, self.immunity_end_frame - self.scheduler.now)
+
+    @property
+    def bullet_latency_count(self):
+        """Number of frames left before character can shoot again"""
+        return max(0, self.next_shot_frame - self.scheduler.now)
+
     @property
     def is_immune(self):
         """Checks if character is immune to damage"""
@@ -701,10 +1195,33 @@ class MainCharacter(Character):
         """Indicates that character was hit by goblin"""
         if not self.is_immune:
             self.hp_bar.deal_damage(5)
-            self.damage_count = MainCharacter.damage_immunity_time
+            self.immunity_end_frame = self.scheduler.now + MainCharacter.damage_immunity_time
             return True
         return False
 
+    @property
+    def horizontal_speed(self):
+        """Maximum horizontal distance character may move in a frame (until new commands are given)"""
+        if self.is_walking:
+            return self.walking_velocity
+        if self.is_jumping:
+            return abs(self.horizontal_jump_velocity)
+        return 0
+
+    def skip_frames(self, world, num_frames):
+        """
+        Moves character num_frames frames forward, as if go_to_next_frame was called that many times.
+        Walking is done in closed form when position is a whole number of pixels (so result is exact)
+        :param world: World that constrains character
+        :param num_frames: Number of frames
+        """
+        if self.is_walking and float(self.hit_box.x_coord).is_integer():
+            displacement = num_frames * self.walking_velocity
+            self.hit_box.x_coord += displacement if self.is_walking_right else -displacement
+            self.hit_box.keep_in_world(world)
+        elif self.is_walking or self.is_jumping:
+            super().skip_frames(world, num_frames)
+
     def is_mid_air(self, world):
         """Checks if character is not touching the ground"""
         return self.hit_box.height + self.hit_box.y_coord < world.ground_level
@@ -762,14 +1279,6 @@ class MainCharacter(Character):
                 self.horizontal_jump_velocity = 0
             self.hit_box.keep_in_world(world)
 
-        # Count down damage immunity time
-        if self.damage_count > 0:
-            self.damage_count -= 1
-
-        # Count down bullet latency time
-        if self.bullet_latency_count > 0:
-            self.bullet_latency_count -= 1
-
     def flicker(self):
         """Indicates if character should not be  drawn on this frame"""
         if not self.is_immune:
@@ -777,16 +1286,35 @@ class MainCharacter(Character):
         m = self.damage_count % 6
         return m >= 3
 
-    def draw(self, win):
+    @property
+    def mask(self):
+        """Mask of sprite that main character is displayed with"""
+        if self.is_walking:
+            return super().mask
+        if self.is_facing_left:
+            return MainCharacter.char_walking_left.get_mask(0)
+        if self.is_facing_right:
+            return MainCharacter.char_walking_right.get_mask(0)
+        return MainCharacter.facing_camera_mask
+
+    @property
+    def shows_walking_animation(self):
+        """Checks if walking animation is displayed when character is drawn"""
+        return self.is_walking and not self.flicker()
+
+    def draw(self, win, advance_animation=True, draw_hp_bar=True):
         """
         Draw main character
         :param win: Window where character is to be drawn
+        :param advance_animation: False if animation should stay on the same frame
+        :param draw_hp_bar: False if HP bar should not be drawn
         """
         if self.flicker():
-            self.hp_bar.draw(self, win)
+            if draw_hp_bar:
+                self.hp_bar.draw(self, win)
         else:
-            if self.is_walking:
-                super().draw(win)
+            if self.shows_walking_animation:
+                super().draw(win, advance_animation, draw_hp_bar)
             else:
                 if self.is_facing_left:
                     img = MainCharacter.char_walking_left.get_sprite(0)
@@ -795,4 +1323,98 @@ class MainCharacter(Character):
                 else:
                     img = MainCharacter.facing_camera_sprite
                 win.blit(img, self.hit_box.position)
-                self.hp_bar.draw(self, win)
+                if draw_hp_bar:
+                    self.hp_bar.draw(self, win)
+
+
+class FrameBudgetGovernor:
+    """
+    Watches how long each frame takes to update and draw, lowering world quality when frames go over budget and
+    restoring it when there is headroom again
+    """
+    # Each quality level: (animation stride, HP bar draw distance, sounds enabled, goblin cap)
+    quality_levels = [
+        (1, None, True, None),  # Full quality
+        (2, None, True, None),  # Animations at half rate
+        (2, 250, True, None),  # No HP bars on distant goblins
+        (2, 250, False, None),  # No sound effects
+        (2, 250, False, 6),  # Extra goblins folded into tougher ones
+    ]
+    smoothing = 0.1  # Weight of newest frame in moving average of frame time
+    over_budget_ratio = 0.9  # Quality steps down when average frame time is above this fraction of budget
+    headroom_ratio = 0.5  # Quality steps up when average frame time is below this fraction of budget
+    frames_to_step_down = 10  # Number of consecutive frames over budget before stepping down
+    frames_to_step_up = 90  # Number of consecutive frames with headroom before stepping up
+    settle_frames = round(1 / smoothing)  # Frames after a step during which average adapts to new level, uncounted
+
+    def __init__(self, world, frame_rate):
+        """
+        Initialize new governor
+        :param world: World whose quality settings are adjusted
+        :param frame_rate: Target frames per second (frame budget is its inverse)
+        """
+        self.world = world
+        self.frame_budget = 1 / frame_rate
+        self.level = 0
+        self.average_frame_time = 0
+        self.frames_over_budget = 0
+        self.frames_with_headroom = 0
+        self.frames_to_settle = 0
+        self.adjustments = []  # (frame, old level, new level, reason)
+
+    def record_frame_time(self, frame_time):
+        """
+        Registers time spent updating and drawing last frame, adjusting quality if needed
+        :param frame_time: Time in seconds
+        """
+        if self.average_frame_time == 0:
+            self.average_frame_time = frame_time
+        else:
+            self.average_frame_time += FrameBudgetGovernor.smoothing * (frame_time - self.average_frame_time)
+
+        # Average still mostly reflects previous level, so it is not judged yet
+        if self.frames_to_settle > 0:
+            self.frames_to_settle -= 1
+            return
+
+        if self.average_frame_time > FrameBudgetGovernor.over_budget_ratio * self.frame_budget:
+            self.frames_over_budget += 1
+            self.frames_with_headroom = 0
+        elif self.average_frame_time < FrameBudgetGovernor.headroom_ratio * self.frame_budget:
+            self.frames_with_headroom += 1
+            self.frames_over_budget = 0
+        else:
+            self.frames_over_budget = 0
+            self.frames_with_headroom = 0
+
+        max_level = len(FrameBudgetGovernor.quality_levels) - 1
+        if self.frames_over_budget >= FrameBudgetGovernor.frames_to_step_down and self.level < max_level:
+            self.set_level(self.level + 1, "over budget")
+        elif self.frames_with_headroom >= FrameBudgetGovernor.frames_to_step_up and self.level > 0:
+            self.set_level(self.level - 1, "headroom")
+
+    def set_level(self, new_level, reason):
+        """
+        Applies quality level to world and logs the adjustment
+        :param new_level: Index of quality level (0 is full quality)
+        :param reason: Why quality is being changed
+        """
+        self.adjustments.append((self.world.frame_count, self.level, new_level, reason))
+        logger.info("Frame %d: quality level %d -> %d (%s: average frame time %.1f ms, budget %.1f ms)",
+                    self.world.frame_count, self.level, new_level, reason, 1000 * self.average_frame_time,
+                    1000 * self.frame_budget)
+        self.level = new_level
+        self.frames_over_budget = 0
+        self.frames_with_headroom = 0
+        self.frames_to_settle = FrameBudgetGovernor.settle_frames
+
+        animation_stride, hp_bar_draw_distance, sounds_enabled, goblin_cap = FrameBudgetGovernor.quality_levels[
+            new_level]
+        self.world.animation_stride = animation_stride
+        self.world.hp_bar_draw_distance = hp_bar_draw_distance
+        self.world.sounds_enabled = sounds_enabled
+        self.world.goblin_cap = goblin_cap
+
+    def __str__(self):
+        return f"\tQuality level: {self.level}\n\tAverage frame time: {1000 * self.average_frame_time:.1f} ms" \
+               f"\n\tFrame budget: {1000 * self.frame_budget:.1f} ms"
@@ -1,29 +1,60 @@
 # Import section
+import logging
+from argparse import ArgumentParser
+from time import perf_counter
+
 from pygame import time, init, display, event, key, quit, QUIT, K_SPACE, K_DOWN, K_UP, K_RIGHT, K_LEFT
 
-from game_classes import World
+from frame_export import FrameExporter
+from game_classes import World, FrameBudgetGovernor
+from simulation_pipeline import SimulationPipeline
+from telemetry import SessionTelemetry
+
+# Command line section
+parser = ArgumentParser(description="Baldy vs goblins")
+parser.add_argument("--pipelined", action="store_true",
+                    help="Simulate next frame on another thread while current frame is drawn")
+parser.add_argument("--telemetry-dir", help="Directory where session telemetry log is written")
+parser.add_argument("--export-frames", metavar="NAME",
+                    help="Mirror drawn frames into shared memory with this name (see spectator_example.py)")
+parser.add_argument("--pixel-perfect", action="store_true",
+                    help="Objects only collide when their visible pixels overlap")
+args = parser.parse_args()
 
 # Constant section
-world = World()
+world = World(pixel_perfect_collisions=args.pixel_perfect)
 win = display.set_mode((852, 480))
 clock = time.Clock()
 frame_rate = 27
+governor = FrameBudgetGovernor(world, frame_rate)
+telemetry = SessionTelemetry.in_directory(args.telemetry_dir) if args.telemetry_dir else None
+world.telemetry = telemetry
+exporter = FrameExporter(win, args.export_frames) if args.export_frames else None
 
 # Setup section
 display.set_caption("Baldy vs goblins")
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s: %(message)s")
 
 
 # Auxiliary functions
-def redraw_game_window():
-    world.draw(win)
+def redraw_game_window(shown_world=world, advance_animations=True):
+    shown_world.draw(win, advance_animations)
+    if exporter is not None:
+        exporter.publish(win)
     display.update()
 
 
-def check_events():
-    if world.main_character_died:
+def check_events(shown_world=world):
+    if shown_world.main_character_died:
         global game_over
         game_over = True
-        draw_game_over()
+        draw_game_over(shown_world)
+
+
+def record_frame_time(frame_time):
+    governor.record_frame_time(frame_time)
+    if telemetry is not None:
+        telemetry.record_frame_time(frame_time)
 
 
 def play_intro():
@@ -32,8 +63,10 @@ def play_intro():
     time.delay(3000)
 
 
-def draw_game_over():
-    world.draw_game_over(win)
+def draw_game_over(shown_world=world):
+    shown_world.draw_game_over(win)
+    if exporter is not None:
+        exporter.publish(win)
     display.update()
 
 
@@ -42,8 +75,15 @@ init()
 
 play_intro()
 
+pipeline = None
+if args.pipelined:
+    # Governor and telemetry change and record world, so they are fed on simulation thread, between frames
+    pipeline = SimulationPipeline(world, record_frame_time)
+    pipeline.start()
+
 run = True
 game_over = False
+frame_time = None  # Time taken by last frame, not yet sent to simulation thread
 while run:
     clock.tick(frame_rate)
     for e in event.get():
@@ -62,9 +102,28 @@ while run:
             commands.append("down")
         if keys[K_SPACE]:
             commands.append("shoot")
-        world.give_commands(commands)
-        world.go_to_next_frame()
-        redraw_game_window()
-        check_events()
+        frame_start = perf_counter()
+        if pipeline is None:
+            world.give_commands(commands)
+            world.go_to_next_frame()
+            redraw_game_window()
+            record_frame_time(perf_counter() - frame_start)
+            check_events()
+        else:
+            pipeline.submit(commands, frame_time)
+            snapshot = pipeline.take()
+            render_start = perf_counter()
+            redraw_game_window(snapshot, advance_animations=False)
+            pipeline.record_render(render_start, perf_counter())
+            frame_time = perf_counter() - frame_start
+            check_events(snapshot)
+
+if pipeline is not None:
+    pipeline.stop()
+    logging.info("Pipeline statistics:\n%s", pipeline)
+if telemetry is not None:
+    telemetry.close()
+if exporter is not None:
+    exporter.close()
 
 quit()
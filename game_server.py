@@ -0,0 +1,362 @@
+"""
+Hosts many independent single player games in one process. Each client connects over TCP, gets its own headless
+world, sends input bitmasks and receives compact state frames. All worlds are ticked by one shared scheduler.
+
+    python game_server.py --port 8765
+    python game_server.py --bench 300 --seconds 10  # Measure how many sessions a core can sustain
+
+Client to server: one byte per input change. Bits 0-4 are left, right, up, down and shoot (held until next byte).
+A byte with bit 7 set changes session tick rate to its lower 7 bits (frames per second).
+
+Server to client: frames made of a 2 byte length followed by state: frame number, score, HP, main character flags and
+position, then goblins (position, HP percentage, direction), bullets (position) and potions (position, frames left).
+"""
+# Import section
+import asyncio
+import logging
+import os
+from argparse import ArgumentParser
+from heapq import heappop, heappush
+from random import randint
+from struct import Struct
+from time import perf_counter
+
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")  # Sounds are never played by server
+
+from game_classes import World  # Imported after audio driver is chosen, since game classes set up mixer
+from histogram import Histogram
+
+# Constant section
+command_bits = ["left", "right", "up", "down", "shoot"]
+tick_rate_flag = 0x80
+frame_length_format = Struct("<H")
+# Frame, score, HP, main character flags, x, y, number of goblins, bullets and potions
+state_header_format = Struct("<IIhBhhBBB")
+goblin_format = Struct("<hhBB")  # x, y, HP percentage, 1 if walking right
+bullet_format = Struct("<hh")  # x, y
+potion_format = Struct("<hhB")  # x, y, frames left (at most 255)
+max_listed = 255  # Objects of each kind sent per frame
+tick_time_bucket = 10e-6  # Width of tick time histogram buckets, in seconds
+num_tick_time_buckets = 1000  # Histograms cover ticks up to 10 ms
+
+logger = logging.getLogger(__name__)
+
+
+# Functions section
+def commands_from_mask(input_mask):
+    """Converts input bitmask into list of commands, as in World.give_commands"""
+    return [command for bit, command in enumerate(command_bits) if input_mask & (1 << bit)]
+
+
+def encode_state(world):
+    """Packs world state into a frame (length prefixed)"""
+    baldy = world.baldy
+    flags = baldy.is_walking | baldy.is_jumping << 1 | baldy.is_facing_left << 2 | baldy.is_facing_right << 3 | \
+        baldy.is_immune << 4 | baldy.is_dead << 5
+    goblins = world.goblins[:max_listed]
+    bullets = world.bullets[:max_listed]
+    potions = world.potions[:max_listed]
+    parts = [state_header_format.pack(world.frame_count, world.score, baldy.hp_bar.health_points, flags,
+                                      int(baldy.hit_box.x_coord), int(baldy.hit_box.y_coord), len(goblins),
+                                      len(bullets), len(potions))]
+    for goblin in goblins:
+        hp_percentage = max(0, 100 * goblin.hp_bar.health_points // goblin.hp_bar.max_health_points)
+        parts.append(goblin_format.pack(int(goblin.hit_box.x_coord), int(goblin.hit_box.y_coord), hp_percentage,
+                                        goblin.is_walking_right))
+    for bullet in bullets:
+        parts.append(bullet_format.pack(bullet.x, bullet.y))
+    for potion in potions:
+        parts.append(potion_format.pack(int(potion.hit_box.x_coord), int(potion.hit_box.y_coord),
+                                        min(potion.timer, 255)))
+    payload = b"".join(parts)
+    return frame_length_format.pack(len(payload)) + payload
+
+
+def decode_state(payload):
+    """Unpacks frame payload (without length prefix) into a dictionary, for clients and debugging"""
+    frame, score, hp, flags, x_coord, y_coord, num_goblins, num_bullets, num_potions = \
+        state_header_format.unpack_from(payload)
+    position = state_header_format.size
+    goblins = []
+    for _ in range(num_goblins):
+        goblins.append(goblin_format.unpack_from(payload, position))
+        position += goblin_format.size
+    bullets = []
+    for _ in range(num_bullets):
+        bullets.append(bullet_format.unpack_from(payload, position))
+        position += bullet_format.size
+    potions = []
+    for _ in range(num_potions):
+        potions.append(potion_format.unpack_from(payload, position))
+        position += potion_format.size
+    return {"frame": frame, "score": score, "hp": hp, "flags": flags, "position": (x_coord, y_coord),
+            "goblins": goblins, "bullets": bullets, "potions": potions}
+
+
+def new_tick_histogram():
+    """Returns empty histogram of tick times, in seconds"""
+    return Histogram(tick_time_bucket, num_tick_time_buckets)
+
+
+def describe_tick_times(histogram):
+    """Returns percentiles and maximum of tick times in histogram, in milliseconds"""
+    return f"tick p50/p99/max {1000 * histogram.percentile(50):.3f}/{1000 * histogram.percentile(99):.3f}/" \
+           f"{1000 * histogram.max_value:.3f} ms"
+
+
+# Classes section
+class GameSession:
+    """Single player game hosted by server"""
+    max_buffered_bytes = 16384  # Frames are dropped while more than this is waiting to be sent to a slow client
+
+    def __init__(self, session_id, tick_rate, writer=None):
+        """
+        Initialize new session with a headless world
+        :param session_id: Number identifying session in reports
+        :param tick_rate: Frames per second
+        :param writer: asyncio stream writer for client (None if frames are not sent anywhere, e.g. in benchmark)
+        """
+        self.session_id = session_id
+        self.world = World(particle_capacity=0)
+        self.world.sounds_enabled = False
+        self.tick_rate = tick_rate
+        self.writer = writer
+        self.input_mask = 0
+        self.is_active = True
+        self.num_ticks = 0
+        self.frames_dropped = 0
+        self.tick_latencies = new_tick_histogram()  # Time spent on ticks (simulation and encoding) since last report
+        self.max_lateness = 0  # Longest delay between scheduled and actual tick since last report, in seconds
+
+    @property
+    def tick_interval(self):
+        """Seconds between ticks"""
+        return 1 / self.tick_rate
+
+    def receive(self, data):
+        """
+        Handles bytes sent by client
+        :param data: Input bitmasks and tick rate changes
+        """
+        for byte in data:
+            if byte & tick_rate_flag:
+                self.tick_rate = max(1, byte & ~tick_rate_flag)
+            else:
+                self.input_mask = byte
+
+    def tick(self, lateness):
+        """
+        Moves world to next frame and sends its state to client
+        :param lateness: Seconds between scheduled time of tick and now
+        :return: Seconds spent on tick
+        """
+        start = perf_counter()
+        self.world.give_commands(commands_from_mask(self.input_mask))
+        self.world.go_to_next_frame()
+        frame = encode_state(self.world)
+        tick_time = perf_counter() - start
+        self.tick_latencies.add(tick_time)
+        self.max_lateness = max(self.max_lateness, lateness)
+        self.num_ticks += 1
+
+        if self.writer is not None:
+            if self.writer.is_closing():
+                self.is_active = False
+                return tick_time
+            # Every frame holds the whole state, so frames can be dropped instead of waiting for slow clients
+            if self.writer.transport.get_write_buffer_size() > GameSession.max_buffered_bytes:
+                self.frames_dropped += 1
+            else:
+                self.writer.write(frame)
+        if self.world.main_character_died:
+            self.is_active = False
+            if self.writer is not None:
+                self.writer.close()
+        return tick_time
+
+    def __str__(self):
+        return f"\tSession {self.session_id}: frame {self.world.frame_count}, score {self.world.score}, " \
+               f"{self.tick_rate} fps, {describe_tick_times(self.tick_latencies)}, max lateness {1000 * self.max_lateness:.1f} ms, " \
+               f"dropped {self.frames_dropped}"
+
+
+class SessionHost:
+    """Ticks every session at its own rate from a single scheduler coroutine"""
+
+    num_worst_sessions = 5  # Sessions with slowest ticks listed in each report
+
+    def __init__(self, tick_rate=27, max_sessions=1000):
+        """
+        Initialize new host
+        :param tick_rate: Frames per second of new sessions
+        :param max_sessions: Connections beyond this number are refused
+        """
+        self.tick_rate = tick_rate
+        self.max_sessions = max_sessions
+        self.sessions = {}
+        self.deadlines = []  # Heap of (time of next tick, session id)
+        self.num_created = 0
+        self.busy_time = 0  # Seconds spent ticking and reporting since last report
+        self.num_ticks = 0  # Ticks since last report
+        self.tick_latencies = new_tick_histogram()  # Ticks of every session since last report
+        self.last_report = None
+        self.session_added = asyncio.Event()
+
+    def add_session(self, writer=None):
+        """Creates new session, returning it (or None if host is full)"""
+        if len(self.sessions) >= self.max_sessions:
+            return None
+        self.num_created += 1
+        session = GameSession(self.num_created, self.tick_rate, writer)
+        self.sessions[session.session_id] = session
+        loop = asyncio.get_running_loop()
+        heappush(self.deadlines, (loop.time() + session.tick_interval, session.session_id))
+        self.session_added.set()
+        return session
+
+    def remove_session(self, session):
+        """Stops ticking session (its deadline is dropped when it comes up)"""
+        session.is_active = False
+        self.sessions.pop(session.session_id, None)
+
+    async def run(self):
+        """Scheduler loop: ticks sessions whose time has come, then sleeps until next deadline"""
+        loop = asyncio.get_running_loop()
+        self.last_report = loop.time()
+        while True:
+            timeout = self.deadlines[0][0] - loop.time() if self.deadlines else None
+            if timeout is None or timeout > 0:
+                # New sessions may need ticking before current earliest deadline
+                self.session_added.clear()
+                try:
+                    await asyncio.wait_for(self.session_added.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            start = perf_counter()
+            now = loop.time()
+            while self.deadlines and self.deadlines[0][0] <= now:
+                deadline, session_id = heappop(self.deadlines)
+                session = self.sessions.get(session_id)
+                if session is None:
+                    continue
+                self.tick_latencies.add(session.tick(now - deadline))
+                self.num_ticks += 1
+                if not session.is_active:
+                    self.remove_session(session)
+                    continue
+                next_deadline = deadline + session.tick_interval
+                if next_deadline < now:
+                    # Session fell more than a tick behind: skip missed ticks instead of running them in a burst
+                    next_deadline = now + session.tick_interval
+                heappush(self.deadlines, (next_deadline, session_id))
+            self.busy_time += perf_counter() - start
+            await asyncio.sleep(0)  # Lets network reads and writes run between batches
+
+    def report(self):
+        """Returns statistics since last report (including sessions with slowest ticks), and resets them"""
+        start = perf_counter()
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        elapsed = max(now - self.last_report, 1e-9)
+        busy_fraction = self.busy_time / elapsed
+        sessions = list(self.sessions.values())
+        max_lateness = max((session.max_lateness for session in sessions), default=0)
+        sessions_per_core = len(sessions) / busy_fraction if busy_fraction > 0 else 0
+        worst_sessions = sorted(sessions, key=lambda session: session.tick_latencies.max_value,
+                                reverse=True)[:SessionHost.num_worst_sessions]
+        lines = [f"{len(sessions)} sessions, {self.num_ticks / elapsed:.0f} ticks/s, {describe_tick_times(self.tick_latencies)}, "
+                 f"max lateness {1000 * max_lateness:.1f} ms, scheduler busy {100 * busy_fraction:.1f}% of a core "
+                 f"(about {sessions_per_core:.0f} sessions per core at these rates)"]
+        lines += [str(session) for session in worst_sessions]
+
+        self.last_report = now
+        self.num_ticks = 0
+        self.tick_latencies.reset()
+        for session in sessions:
+            session.max_lateness = 0
+            session.tick_latencies.reset()
+        # Reporting blocks ticking too, so it counts as busy time of next report
+        self.busy_time = perf_counter() - start
+        return "\n".join(lines)
+
+    async def report_periodically(self, interval):
+        """Logs statistics every interval seconds"""
+        while True:
+            await asyncio.sleep(interval)
+            logger.info(self.report())
+
+    async def handle_client(self, reader, writer):
+        """Runs session for a connected client until it disconnects or its main character dies"""
+        session = self.add_session(writer)
+        if session is None:
+            writer.close()
+            return
+        peer = writer.get_extra_info("peername")
+        logger.info("Session %d started for %s", session.session_id, peer)
+        try:
+            while session.is_active:
+                data = await reader.read(64)
+                if not data:
+                    break
+                session.receive(data)
+        except ConnectionError:
+            pass
+        finally:
+            logger.info("Session %d ended\n%s", session.session_id, session)
+            self.remove_session(session)
+            writer.close()
+
+
+# Entry points
+async def serve(host, port, tick_rate, max_sessions, report_interval):
+    """Accepts clients on given address until cancelled"""
+    session_host = SessionHost(tick_rate, max_sessions)
+    server = await asyncio.start_server(session_host.handle_client, host, port)
+    logger.info("Serving on %s", ", ".join(str(socket.getsockname()) for socket in server.sockets))
+    async with server:
+        await asyncio.gather(server.serve_forever(), session_host.run(),
+                             session_host.report_periodically(report_interval))
+
+
+async def bench(num_sessions, seconds, tick_rate):
+    """Runs sessions driven by random inputs without clients, reporting how many sessions a core sustains"""
+    session_host = SessionHost(tick_rate, num_sessions)
+    sessions = [session_host.add_session() for _ in range(num_sessions)]
+    scheduler = asyncio.create_task(session_host.run())
+    start = asyncio.get_running_loop().time()
+    while asyncio.get_running_loop().time() - start < seconds:
+        await asyncio.sleep(1)
+        for session in sessions:
+            if session.is_active and randint(0, 3) == 0:
+                session.receive(bytes([randint(0, 31)]))
+        # Keep population constant when bots die
+        sessions = [session if session.is_active else session_host.add_session() for session in sessions]
+    scheduler.cancel()
+    print(session_host.report())
+
+
+def main():
+    parser = ArgumentParser(description="Host many headless Baldy vs goblins sessions")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--tick-rate", type=int, default=27, help="Frames per second of new sessions")
+    parser.add_argument("--max-sessions", type=int, default=1000)
+    parser.add_argument("--report-interval", type=float, default=10, help="Seconds between statistics reports")
+    parser.add_argument("--bench", type=int, metavar="SESSIONS", help="Run this many bot sessions and report capacity")
+    parser.add_argument("--seconds", type=float, default=10, help="Benchmark duration")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s: %(message)s")
+
+    if args.bench:
+        asyncio.run(bench(args.bench, args.seconds, args.tick_rate))
+    else:
+        try:
+            asyncio.run(serve(args.host, args.port, args.tick_rate, args.max_sessions, args.report_interval))
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()
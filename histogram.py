@@ -0,0 +1,61 @@
+# Classes section
+class Histogram:
+    """
+    Values (e.g. frame or tick times) counted in fixed width buckets, so adding one takes constant time and memory,
+    and percentiles are read without sorting
+    """
+
+    def __init__(self, bucket_width, num_buckets):
+        """
+        Initialize empty histogram
+        :param bucket_width: Range of values counted in each bucket
+        :param num_buckets: Number of buckets (last one also holds every value above range of histogram)
+        """
+        self.bucket_width = bucket_width
+        self.num_buckets = num_buckets
+        self.counts = [0] * num_buckets
+        self.num_values = 0
+        self.total = 0
+        self.max_value = 0
+
+    def add(self, value):
+        """
+        Counts a value
+        :param value: Non-negative value
+        """
+        self.counts[min(int(value / self.bucket_width), self.num_buckets - 1)] += 1
+        self.num_values += 1
+        self.total += value
+        if value > self.max_value:
+            self.max_value = value
+
+    @property
+    def mean(self):
+        """Mean of values (0 if there are none)"""
+        return self.total / self.num_values if self.num_values > 0 else 0
+
+    def percentile(self, percent):
+        """Returns value (rounded up to bucket, at most the maximum) below which given percentage of values are"""
+        threshold = self.num_values * percent / 100
+        count = 0
+        for bucket, bucket_count in enumerate(self.counts):
+            count += bucket_count
+            if count >= threshold and count > 0:
+                return min((bucket + 1) * self.bucket_width, self.max_value)
+        return self.max_value
+
+    def merge(self, other):
+        """Adds values of another histogram with same buckets to this one"""
+        for bucket, bucket_count in enumerate(other.counts):
+            self.counts[bucket] += bucket_count
+        self.num_values += other.num_values
+        self.total += other.total
+        self.max_value = max(self.max_value, other.max_value)
+
+    def reset(self):
+        """Forgets every value"""
+        if self.num_values > 0:
+            self.counts = [0] * self.num_buckets
+            self.num_values = 0
+            self.total = 0
+            self.max_value = 0
@@ -0,0 +1,191 @@
+# Import section
+from math import pi
+
+import numpy as np
+from pygame import surfarray
+
+
+# Constant section
+rgb_masks = (0xFF0000, 0x00FF00, 0x0000FF)  # Pixel format particle colors are packed in (usual 32 bit display format)
+
+
+# Functions section
+def pack_colors(colors):
+    """
+    Returns colors packed into 32 bit integers, in the usual pixel format of 32 bit windows
+    :param colors: Array of shape (n, 3) with RGB colors
+    """
+    colors = np.asarray(colors, np.uint32)
+    return (colors[:, 0] << 16) | (colors[:, 1] << 8) | colors[:, 2]
+
+
+def draw_particles(win, positions, colors, visible=None):
+    """
+    Draws particles as 2x2 pixel squares, writing all of them to window pixels at once
+    :param win: Window where particles are drawn (32 bits per pixel)
+    :param positions: Array of shape (n, 2) with x, y coordinates
+    :param colors: Array of n colors packed by pack_colors
+    :param visible: Optional boolean array of n values, False for particles that are not drawn
+    """
+    if len(positions) == 0:
+        return
+    xs = positions[:, 0].astype(np.intp)
+    ys = positions[:, 1].astype(np.intp)
+    inside = (xs >= 0) & (xs < win.get_width() - 1) & (ys >= 0) & (ys < win.get_height() - 1)
+    if visible is not None:
+        inside &= visible
+    xs, ys, colors = xs[inside], ys[inside], colors[inside]
+    masks = win.get_masks()
+    if masks[:3] != rgb_masks:
+        # Unusual pixel format: repack colors as window would map them (opaque if window has alpha)
+        shifts, losses = win.get_shifts(), win.get_losses()
+        channels = ((colors >> 16) & 0xFF, (colors >> 8) & 0xFF, colors & 0xFF)
+        repacked = np.full(len(colors), masks[3], np.uint32)
+        for channel, shift, loss in zip(channels, shifts, losses):
+            repacked |= (channel >> loss) << shift
+        colors = repacked
+    pixels = surfarray.pixels2d(win)  # Locks window until array is deleted
+    pixels[xs, ys] = colors
+    pixels[xs + 1, ys] = colors
+    pixels[xs, ys + 1] = colors
+    pixels[xs + 1, ys + 1] = colors
+    del pixels
+
+
+# Classes section
+class ParticleSystem:
+    """
+    Fixed capacity pool of short lived particles, stored in arrays that are updated all at once.
+    New particles take the place of the oldest ones, and no more than max_spawn_per_frame particles are created per
+    frame, so cost per frame is bounded no matter how many effects are triggered
+    """
+    # Palettes are packed once, so emitted particles get colors that are written to window pixels as they are
+    hit_spark_colors = pack_colors([(255, 220, 60), (255, 150, 30), (255, 255, 200)])
+    death_burst_colors = pack_colors([(60, 140, 40), (120, 180, 60), (150, 30, 30)])
+    potion_sparkle_colors = pack_colors([(90, 120, 255), (190, 110, 255), (240, 240, 255)])
+
+    def __init__(self, capacity=65536, max_spawn_per_frame=4096, seed=None):
+        """
+        Initialize new particle system
+        :param capacity: Maximum number of live particles
+        :param max_spawn_per_frame: Particles requested beyond this number in a single frame are dropped
+        :param seed: Seed for random particle directions, speeds and lifetimes
+        """
+        self.capacity = capacity
+        self.positions = np.zeros((capacity, 2), np.float32)
+        self.velocities = np.zeros((capacity, 2), np.float32)
+        self.gravity_scales = np.zeros(capacity, np.float32)
+        self.lifetimes = np.zeros(capacity, np.int32)  # Frames left to live (0 if particle is dead)
+        self.colors = np.zeros(capacity, np.uint32)  # Packed by pack_colors
+        self.next_index = 0
+        self.max_spawn_per_frame = max_spawn_per_frame
+        self.spawn_budget = max_spawn_per_frame
+        self.num_dropped = 0  # Particles not created because spawn budget ran out
+        self.frames_left = 0  # Frames until every particle is dead
+        self.random_generator = np.random.default_rng(seed)
+
+    @property
+    def is_empty(self):
+        """Checks if there are no live particles"""
+        return self.frames_left == 0
+
+    def emit(self, position, count, speed_range, angle_range, lifetime_range, palette, gravity_scale):
+        """
+        Creates particles at given position, with random velocities, lifetimes and colors
+        :param position: x, y coordinates where particles start
+        :param count: Number of particles requested
+        :param speed_range: (min, max) speed in pixels per frame
+        :param angle_range: (min, max) direction in radians (0 points right, pi / 2 points down)
+        :param lifetime_range: (min, max) lifetime in frames
+        :param palette: Array of packed colors particles are randomly painted with
+        :param gravity_scale: Fraction of gravitational acceleration particles feel
+        """
+        requested_count = count
+        count = min(count, self.spawn_budget, self.capacity)
+        self.num_dropped += requested_count - count
+        if count <= 0:
+            return
+        self.spawn_budget -= count
+
+        generator = self.random_generator
+        speeds = generator.uniform(speed_range[0], speed_range[1], count)
+        angles = generator.uniform(angle_range[0], angle_range[1], count)
+        lifetimes = generator.integers(lifetime_range[0], lifetime_range[1], count, endpoint=True)
+        colors = palette[generator.integers(0, len(palette), count)]
+
+        # Write to ring buffer slots [next_index, next_index + count), wrapping around the end
+        first_part = min(count, self.capacity - self.next_index)
+        for start, stop, offset in ((self.next_index, self.next_index + first_part, 0),
+                                    (0, count - first_part, first_part)):
+            if stop <= start:
+                continue
+            new = slice(offset, offset + stop - start)
+            self.positions[start:stop] = position
+            self.velocities[start:stop, 0] = speeds[new] * np.cos(angles[new])
+            self.velocities[start:stop, 1] = speeds[new] * np.sin(angles[new])
+            self.gravity_scales[start:stop] = gravity_scale
+            self.lifetimes[start:stop] = lifetimes[new]
+            self.colors[start:stop] = colors[new]
+        self.next_index = (self.next_index + count) % self.capacity
+        self.frames_left = max(self.frames_left, int(lifetime_range[1]))
+
+    def emit_hit_sparks(self, position, is_going_right):
+        """Sparks flying back from where a bullet hit"""
+        direction = pi if is_going_right else 0
+        self.emit(position, 30, (2, 7), (direction - 0.8, direction + 0.8), (6, 14), ParticleSystem.hit_spark_colors,
+                  0.3)
+
+    def emit_death_burst(self, position):
+        """Burst of particles where a goblin died"""
+        self.emit(position, 400, (1, 9), (0, 2 * pi), (20, 40), ParticleSystem.death_burst_colors, 0.4)
+
+    def emit_potion_sparkles(self, position):
+        """Sparkles slowly rising from a potion that was taken"""
+        self.emit(position, 200, (0.5, 3), (pi, 2 * pi), (20, 45), ParticleSystem.potion_sparkle_colors, -0.02)
+
+    def go_to_next_frame(self, world):
+        """
+        Moves every particle under world gravity, removing particles that died or reached the ground
+        :param world: World with gravitational acceleration and ground level
+        """
+        self.spawn_budget = self.max_spawn_per_frame
+        if self.frames_left == 0:
+            return
+        self.frames_left -= 1
+
+        self.velocities[:, 1] += world.gravitational_acceleration * self.gravity_scales
+        self.positions += self.velocities
+        np.subtract(self.lifetimes, 1, out=self.lifetimes)
+        np.maximum(self.lifetimes, 0, out=self.lifetimes)
+        self.lifetimes[self.positions[:, 1] >= world.ground_level] = 0
+
+    def snapshot(self):
+        """Returns copy of live particles that can be drawn while this system moves on to next frames"""
+        live = np.flatnonzero(self.lifetimes) if self.frames_left > 0 else np.zeros(0, np.intp)
+        return ParticleSnapshot(self.positions[live], self.colors[live])
+
+    def draw(self, win):
+        """Draws live particles on given window, straight from pool (without copying them as snapshot does)"""
+        if self.frames_left > 0:
+            draw_particles(win, self.positions, self.colors, self.lifetimes > 0)
+
+    def __str__(self):
+        return f"\tLive particles: {np.count_nonzero(self.lifetimes)}/{self.capacity}" \
+               f"\n\tDropped particles: {self.num_dropped}"
+
+
+class ParticleSnapshot:
+    """Positions and colors of live particles at a given frame"""
+
+    def __init__(self, positions, colors):
+        """
+        Initialize new snapshot
+        :param positions: Array of shape (n, 2) with x, y coordinates
+        :param colors: Array of n colors packed by pack_colors
+        """
+        self.positions = positions
+        self.colors = colors
+
+    def draw(self, win):
+        """Draws particles on given window"""
+        draw_particles(win, self.positions, self.colors)
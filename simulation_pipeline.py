@@ -0,0 +1,118 @@
+# Import section
+from queue import Queue
+from threading import Thread
+from time import perf_counter
+
+
+# Classes section
+class SimulationPipeline:
+    """
+    Runs world simulation on its own thread, one frame ahead of the thread that draws it.
+    While frame N is drawn from an immutable snapshot, frame N+1 is being simulated
+    """
+
+    def __init__(self, world, frame_time_listener=None, queue_size=1):
+        """
+        Initialize new pipeline
+        :param world: World to simulate. It must not be touched by other threads while pipeline runs
+        :param frame_time_listener: Function called with every frame time sent through submit. It runs on simulation
+        thread between frames, so it may change world (e.g. quality settings) and whatever records it
+        :param queue_size: How many simulated frames may wait to be drawn
+        """
+        self.world = world
+        self.frame_time_listener = frame_time_listener
+        self.commands = Queue(maxsize=1)
+        self.snapshots = Queue(maxsize=queue_size + 1)
+        # First frame to draw is current world state, so simulation starts one frame ahead
+        self.snapshots.put((world.snapshot(), None))
+        self.thread = Thread(target=self.simulate, name="simulation", daemon=True)
+        self.last_render_interval = None
+        self.num_frames = 0
+        self.simulation_time = 0
+        self.render_time = 0
+        self.overlap_time = 0  # Time that simulation and rendering ran at the same time
+
+    def start(self):
+        """Starts simulation thread"""
+        self.thread.start()
+
+    def stop(self):
+        """Stops simulation thread after it finishes current frame"""
+        while not self.snapshots.empty():
+            self.snapshots.get()
+        if self.thread.is_alive():
+            self.commands.put(None)
+            self.thread.join()
+
+    def simulate(self):
+        """
+        Simulation thread loop: moves world to next frame for every set of commands received. An exception ends the
+        loop and is passed on to the drawing thread, which raises it from take
+        """
+        while True:
+            message = self.commands.get()
+            if message is None:
+                break
+            commands, frame_time = message
+            try:
+                if frame_time is not None and self.frame_time_listener is not None:
+                    self.frame_time_listener(frame_time)
+                start = perf_counter()
+                self.world.give_commands(commands)
+                self.world.go_to_next_frame()
+                snapshot = self.world.snapshot()
+            except Exception as error:
+                self.snapshots.put((None, error))
+                break
+            self.snapshots.put((snapshot, (start, perf_counter())))
+
+    def submit(self, commands, frame_time=None):
+        """
+        Sends player commands for next frame to simulation thread
+        :param commands: List of commands, as in World.give_commands
+        :param frame_time: Time in seconds taken by last drawn frame, passed to frame_time_listener before next frame
+        is simulated (None if there is no new measurement)
+        """
+        self.commands.put((commands, frame_time))
+
+    def take(self):
+        """
+        Returns snapshot of world to be drawn, waiting for simulation thread if it is not ready yet
+        :raises Exception: Whatever simulation thread raised, if it failed
+        """
+        snapshot, simulation_interval = self.snapshots.get()
+        if isinstance(simulation_interval, Exception):
+            raise simulation_interval
+        if simulation_interval is not None:
+            self.num_frames += 1
+            self.simulation_time += simulation_interval[1] - simulation_interval[0]
+            if self.last_render_interval is not None:
+                # Previous frame was drawn while this one was simulated
+                overlap_start = max(simulation_interval[0], self.last_render_interval[0])
+                overlap_end = min(simulation_interval[1], self.last_render_interval[1])
+                self.overlap_time += max(0, overlap_end - overlap_start)
+        return snapshot
+
+    def record_render(self, start, end):
+        """
+        Registers time interval in which last snapshot was drawn
+        :param start: perf_counter value when drawing started
+        :param end: perf_counter value when drawing (and display update) finished
+        """
+        self.render_time += end - start
+        self.last_render_interval = (start, end)
+
+    @property
+    def overlap_ratio(self):
+        """Fraction of the shorter of simulation and render time that ran in parallel with the other"""
+        shorter_time = min(self.simulation_time, self.render_time)
+        if shorter_time == 0:
+            return 0
+        return self.overlap_time / shorter_time
+
+    def __str__(self):
+        num_frames = max(self.num_frames, 1)
+        return f"\tFrames: {self.num_frames}" \
+               f"\n\tAverage simulation time: {1000 * self.simulation_time / num_frames:.2f} ms" \
+               f"\n\tAverage render time: {1000 * self.render_time / num_frames:.2f} ms" \
+               f"\n\tOverlap: {100 * self.overlap_ratio:.0f}%"
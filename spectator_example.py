@@ -0,0 +1,89 @@
+"""
+Example spectator process: follows frames exported by a running game (game_main.py --export-frames NAME) and prints
+frame statistics once per second
+
+    python spectator_example.py NAME
+"""
+# Import section
+from argparse import ArgumentParser
+from time import sleep, time
+
+import numpy as np
+
+from frame_export import FrameReader
+
+
+# Functions section
+def follow_frames(reader, duration=None, poll_interval=0.002, report=print):
+    """
+    Reads newest frames as they are exported, reporting statistics every second
+    :param reader: FrameReader attached to exported frames
+    :param duration: Seconds to follow frames for (None to follow forever)
+    :param poll_interval: Seconds between checks for a new frame
+    :param report: Function called with statistics line every second (None for no reports)
+    :return: Total number of frames read, missed and torn (overwritten while being read)
+    """
+    layout = reader.layout
+    channel_bytes = [shift // 8 for shift in reader.shifts[:3]]
+    start = time()
+    report_time = start + 1
+    last_index = reader.latest_frame_index
+    num_read = num_missed = num_torn = 0
+    interval_read = 0
+    latencies = []
+    brightness = 0
+    while duration is None or time() - start < duration:
+        latest_index = reader.latest_frame_index
+        if latest_index == last_index:
+            sleep(poll_interval)
+        else:
+            if last_index >= 0:
+                num_missed += latest_index - last_index - 1
+            last_index = latest_index
+            frame = reader.read(latest_index)
+            if frame is None:
+                num_torn += 1
+            else:
+                # Pixels are read in place, straight from shared memory
+                pixels = np.frombuffer(frame.pixels, np.uint8).reshape(layout.height, layout.pitch)
+                rgb = pixels[:, :layout.width * layout.bytes_per_pixel].reshape(layout.height, layout.width,
+                                                                                layout.bytes_per_pixel)
+                brightness = float(rgb[:, :, channel_bytes].mean())
+                latency = time() - frame.timestamp
+                del pixels, rgb
+                if frame.is_valid:
+                    num_read += 1
+                    interval_read += 1
+                    latencies.append(latency)
+                else:
+                    num_torn += 1
+                frame.release()
+
+        now = time()
+        if report is not None and now >= report_time:
+            mean_latency = 1000 * sum(latencies) / len(latencies) if latencies else 0
+            report(f"Frame {last_index}: {interval_read} fps, mean brightness {brightness:.1f}, "
+                   f"latency {mean_latency:.2f} ms, missed {num_missed}, torn {num_torn}")
+            report_time = now + 1
+            interval_read = 0
+            latencies = []
+    return num_read, num_missed, num_torn
+
+
+def main():
+    parser = ArgumentParser(description="Print statistics of frames exported by a running game")
+    parser.add_argument("name", help="Shared memory name given to --export-frames")
+    parser.add_argument("--duration", type=float, help="Seconds to run for")
+    args = parser.parse_args()
+
+    reader = FrameReader(args.name)
+    try:
+        follow_frames(reader, args.duration)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        reader.close()
+
+
+if __name__ == "__main__":
+    main()
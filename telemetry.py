@@ -0,0 +1,224 @@
+"""
+Session telemetry: World records one compact entry per frame into an in-memory buffer, which is appended in large
+batches to a binary log file. Running this module aggregates any number of log files:
+
+    python telemetry.py telemetry/*.bin
+"""
+# Import section
+import mmap
+import os
+from argparse import ArgumentParser
+from struct import Struct
+from time import strftime
+from uuid import uuid4
+
+from histogram import Histogram
+
+# Constant section
+file_header = b"BVGTLM1\n"  # Identifies telemetry logs (and their format version)
+batch_header = Struct("<I")  # Number of bytes in batch
+# Frame, score, HP, goblins, potions taken, shots fired, shots hit, longest frame time since last record (microseconds)
+record_format = Struct("<IIhHHIII")
+frame_time_format = Struct("<I")  # Last field of record, written once frame time is known
+frame_time_offset = record_format.size - frame_time_format.size
+frame_time_bucket = 100  # Width of frame time histogram buckets, in microseconds
+num_frame_time_buckets = 1000  # Histograms cover frames up to 100 ms
+
+
+# Classes section
+class SessionTelemetry:
+    """
+    Buffers one record per frame (or per sample_interval frames), writing them to an append-only log in large batches.
+    A record costs about 1 microsecond, against roughly 1 millisecond to update and draw a frame.
+    World is recorded before its frame is drawn, so frame time of latest record is filled in by record_frame_time.
+    Both methods must be called from the same thread. When simulation runs in a separate thread (pipelined game loop),
+    frame times reach it one frame late, so each lands in the record after its own
+    """
+
+    def __init__(self, path, batch_size=4096, sample_interval=1):
+        """
+        Initialize new session log
+        :param path: Log file path (must not exist yet, so each log holds exactly one session)
+        :param batch_size: Number of records kept in memory before they are written to file
+        :param sample_interval: World is recorded once every sample_interval frames (useful for headless worlds,
+        whose frames are much cheaper than drawn ones)
+        """
+        self.path = path
+        self.buffer = bytearray(batch_size * record_format.size)
+        self.buffer_position = 0
+        self.sample_interval = sample_interval
+        self.frame_time = 0  # Longest frame time since last record, in seconds
+        self.pending_record = None  # Buffer position of latest record, until its frame time is known
+        self.log_file = open(path, "xb")
+        self.log_file.write(file_header)
+
+    @classmethod
+    def in_directory(cls, directory, **kwargs):
+        """
+        Creates new log in given directory, named after current date and time plus a random suffix (so sessions
+        started in the same second get separate logs)
+        """
+        os.makedirs(directory, exist_ok=True)
+        file_name = f"{strftime('session-%Y%m%d-%H%M%S')}-{uuid4().hex[:8]}.bin"
+        return cls(os.path.join(directory, file_name), **kwargs)
+
+    def record_frame_time(self, frame_time):
+        """
+        Registers time spent updating and drawing a frame
+        :param frame_time: Time in seconds
+        """
+        if frame_time > self.frame_time:
+            self.frame_time = frame_time
+        if self.pending_record is not None:
+            frame_time_format.pack_into(self.buffer, self.pending_record + frame_time_offset,
+                                        int(1e6 * self.frame_time))
+            self.pending_record = None
+            self.frame_time = 0
+
+    def record(self, world):
+        """Appends state of world to buffer (file is only written when buffer is full)"""
+        # Full buffer is written on next record, so frame time of its last record can still be filled in
+        if self.buffer_position == len(self.buffer):
+            self.flush()
+        record_format.pack_into(self.buffer, self.buffer_position, world.frame_count, world.score,
+                                world.baldy.hp_bar.health_points, len(world.goblins), world.potions_taken,
+                                world.shots_fired, world.shots_hit, int(1e6 * self.frame_time))
+        self.pending_record = self.buffer_position
+        self.buffer_position += record_format.size
+
+    def flush(self):
+        """Writes buffered records to log file as one batch"""
+        if self.buffer_position == 0:
+            return
+        self.log_file.write(batch_header.pack(self.buffer_position))
+        self.log_file.write(memoryview(self.buffer)[:self.buffer_position])
+        self.log_file.flush()
+        self.buffer_position = 0
+        self.pending_record = None
+
+    def close(self):
+        """Writes remaining records and closes log file"""
+        self.flush()
+        self.log_file.close()
+
+
+class TelemetrySummary:
+    """Aggregated statistics over telemetry records of one or more sessions"""
+
+    def __init__(self):
+        """Initialize empty summary"""
+        self.num_sessions = 0
+        self.num_frames = 0
+        self.final_scores = []
+        self.hp_total = 0
+        self.min_hp = None
+        self.goblins_total = 0
+        self.max_goblins = 0
+        self.potions_taken = 0
+        self.shots_fired = 0
+        self.shots_hit = 0
+        self.frame_times = Histogram(frame_time_bucket, num_frame_time_buckets)  # Microseconds
+
+    def add_session(self, records):
+        """
+        Aggregates records of a single session
+        :param records: Iterable of unpacked records, in frame order
+        """
+        last_record = None
+        for record in records:
+            _, _, hp, num_goblins, _, _, _, frame_time = record
+            self.hp_total += hp
+            if self.min_hp is None or hp < self.min_hp:
+                self.min_hp = hp
+            self.goblins_total += num_goblins
+            if num_goblins > self.max_goblins:
+                self.max_goblins = num_goblins
+            self.frame_times.add(frame_time)
+            self.num_frames += 1
+            last_record = record
+
+        if last_record is None:
+            return
+        # Counters are cumulative, so session totals are in last record
+        self.num_sessions += 1
+        self.final_scores.append(last_record[1])
+        self.potions_taken += last_record[4]
+        self.shots_fired += last_record[5]
+        self.shots_hit += last_record[6]
+
+    def merge(self, other):
+        """Adds statistics of another summary to this one"""
+        self.num_sessions += other.num_sessions
+        self.num_frames += other.num_frames
+        self.final_scores += other.final_scores
+        self.hp_total += other.hp_total
+        if other.min_hp is not None and (self.min_hp is None or other.min_hp < self.min_hp):
+            self.min_hp = other.min_hp
+        self.goblins_total += other.goblins_total
+        self.max_goblins = max(self.max_goblins, other.max_goblins)
+        self.potions_taken += other.potions_taken
+        self.shots_fired += other.shots_fired
+        self.shots_hit += other.shots_hit
+        self.frame_times.merge(other.frame_times)
+
+    def __str__(self):
+        if self.num_frames == 0:
+            return "\tNo records"
+        hit_rate = self.shots_hit / self.shots_fired if self.shots_fired > 0 else 0
+        return f"\tSessions: {self.num_sessions}\n\tFrames: {self.num_frames}" \
+               f"\n\tFinal score (mean/max): {sum(self.final_scores) / self.num_sessions:.1f}/{max(self.final_scores)}" \
+               f"\n\tScore per 1000 frames: {1000 * sum(self.final_scores) / self.num_frames:.1f}" \
+               f"\n\tHP (mean/min): {self.hp_total / self.num_frames:.1f}/{self.min_hp}" \
+               f"\n\tGoblins (mean/max): {self.goblins_total / self.num_frames:.2f}/{self.max_goblins}" \
+               f"\n\tPotions taken: {self.potions_taken}" \
+               f"\n\tShots fired: {self.shots_fired}\n\tHit rate: {100 * hit_rate:.1f}%" \
+               f"\n\tFrame time (mean/p50/p95/p99/max): {self.frame_times.mean / 1000:.2f}/" \
+               f"{self.frame_times.percentile(50) / 1000:.1f}/{self.frame_times.percentile(95) / 1000:.1f}/" \
+               f"{self.frame_times.percentile(99) / 1000:.1f}/{self.frame_times.max_value / 1000:.1f} ms"
+
+
+# Functions section
+def read_records(path):
+    """
+    Reads telemetry log through a memory map, yielding records one at a time.
+    A batch that was cut short (e.g. game was killed while writing) ends the log
+    :param path: Log file path
+    """
+    with open(path, "rb") as log_file:
+        if os.fstat(log_file.fileno()).st_size <= len(file_header):
+            return
+        with mmap.mmap(log_file.fileno(), 0, access=mmap.ACCESS_READ) as log_map:
+            if log_map[:len(file_header)] != file_header:
+                raise ValueError(f"{path} is not a telemetry log")
+            log_view = memoryview(log_map)
+            position = len(file_header)
+            try:
+                while position + batch_header.size <= len(log_map):
+                    (batch_length,) = batch_header.unpack_from(log_map, position)
+                    position += batch_header.size
+                    if position + batch_length > len(log_map) or batch_length % record_format.size != 0:
+                        break
+                    yield from record_format.iter_unpack(log_view[position:position + batch_length])
+                    position += batch_length
+            finally:
+                log_view.release()
+
+
+def main():
+    parser = ArgumentParser(description="Aggregate session telemetry logs")
+    parser.add_argument("logs", nargs="+", help="Telemetry log files")
+    parser.add_argument("--per-session", action="store_true", help="Also print summary of each session")
+    args = parser.parse_args()
+
+    summary = TelemetrySummary()
+    for path in args.logs:
+        session_summary = TelemetrySummary()
+        session_summary.add_session(read_records(path))
+        if args.per_session:
+            print(f"{path}:\n{session_summary}")
+        summary.merge(session_summary)
+    print(f"All sessions:\n{summary}")
+
+
+if __name__ == "__main__":
+    main()